@@ -1,9 +1,43 @@
 import os
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from flask import Flask, render_template, request, send_file
-import io
+from datetime import datetime, timezone
+from flask import Flask, render_template, request, send_file, jsonify, Response, stream_with_context, g, has_request_context, redirect, url_for
 import json # Necessário para passar os dados do gráfico
+import hashlib
+import gc
+import shutil
+import threading
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+from collections import OrderedDict
+import gzip
+from contextlib import contextmanager
+import cProfile
+
+try:
+    # fcntl só existe em Unix: no Windows o watcher roda sem trava entre processos
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    # brotli é opcional: sem ele as páginas são comprimidas só com gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    # pyarrow é opcional: sem ele a carga sempre lê os CSVs (sem snapshot em cache)
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
 
 # ----------------------------------------------------
 # CONFIGURAÇÃO DE PASTAS E PREFIXOS
@@ -15,9 +49,124 @@ CAMINHO_PASTA = os.path.join(diretorio_base, 'dados')
 
 PREFIXO = 'cda_fi_BLC'
 COLUNA_FILTRO = 'DENOM_SOCIAL' 
+# Nome dos arquivos mensais: cda_fi_BLC_<bloco>_<AAAAMM>.csv
+PADRAO_ARQUIVO_CDA = re.compile(rf'^{re.escape(PREFIXO)}_(\d+)_(\d{{6}})\.csv$')
+
+# Snapshot colunar (Arrow IPC) gerado a partir dos CSVs e invalidado por mtime/tamanho/hash
+CAMINHO_CACHE = os.path.join(CAMINHO_PASTA, '.cache')
+ARQUIVO_SNAPSHOT = os.path.join(CAMINHO_CACHE, 'dados_consolidados.arrow')
+ARQUIVO_MANIFESTO = os.path.join(CAMINHO_CACHE, 'manifesto.json')
+# Incrementar sempre que mudar o formato/tipagem do que é gravado no snapshot
+VERSAO_SNAPSHOT = 5
+
+# Índice invertido de exposição: tipo de consulta -> colunas usadas como chave
+COLUNAS_EXPOSICAO = {
+    'emissor': ['EMISSOR', 'CPF_CNPJ_EMISSOR'],
+    'ativo': ['CD_ATIVO', 'CD_ATIVO_BV_MERC'],
+}
+
+# Histórico: meses anteriores ficam em dados/historico/ (qualquer subpasta) e são
+# carregados sob demanda, uma partição (mês, bloco) por vez
+CAMINHO_HISTORICO = os.path.join(CAMINHO_PASTA, 'historico')
+CAMINHO_PARTICOES = os.path.join(CAMINHO_CACHE, 'particoes')
+PARTICOES_EM_CACHE = int(os.environ.get('CDA_PARTICOES_EM_CACHE', '16'))
+
+# Com o snapshot em uso, cada worker confere a cada N segundos (numa thread própria)
+# se um snapshot novo foi publicado (flask construir-cache ou o watcher de outro
+# processo) e, se sim, troca os dados sem reiniciar e sem segurar requisições
+INTERVALO_VERIFICACAO_SNAPSHOT = float(os.environ.get('CDA_INTERVALO_VERIFICACAO_SNAPSHOT', '30'))
+
+# Cache de arquivos exportados (/download): endereçado por fundo + formato + versão
+# dos dados, com remoção dos menos usados (LRU) acima do limite de tamanho
+CAMINHO_EXPORTACOES = os.path.join(CAMINHO_CACHE, 'exportacoes')
+LIMITE_CACHE_EXPORTACOES = int(os.environ.get('CDA_LIMITE_CACHE_EXPORTACOES_MB', '512')) * 2**20
+# A partir deste nº de linhas o Excel é escrito linha a linha (xlsxwriter constant_memory)
+LINHAS_EXCEL_CONSTANT_MEMORY = 50_000
+TAMANHO_LOTE_EXPORTACAO = 50_000
+FORMATOS_EXPORTACAO = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Cache das páginas de fundo já renderizadas (HTML e JSON dos gráficos), guardadas
+# já comprimidas; chave: rota + fundo + versão dos dados. LRU limitado em bytes
+LIMITE_CACHE_RESPOSTAS = int(os.environ.get('CDA_LIMITE_CACHE_RESPOSTAS_MB', '64')) * 2**20
+NIVEL_GZIP = 6
+
+# Watcher da pasta dados/: a cada N segundos relê só os CSVs novos/alterados/removidos.
+# Só um processo por máquina faz o trabalho (trava em arquivo); os demais workers
+# recebem o resultado pelo snapshot publicado
+INTERVALO_WATCHER = float(os.environ.get('CDA_INTERVALO_WATCHER', '60'))
+ARQUIVO_TRAVA_WATCHER = os.path.join(CAMINHO_CACHE, 'watcher.lock')
+
+# Métricas no formato do Prometheus (/metrics): limites, em segundos, dos histogramas
+LIMITES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Com vários workers (gunicorn), cada processo grava as suas métricas num arquivo desta
+# pasta a cada CDA_INTERVALO_METRICAS segundos e o /metrics soma todos os arquivos,
+# como o modo multiprocesso do prometheus_client. O gunicorn.conf.py define e limpa a
+# pasta; sem ela, o /metrics mostra só as métricas do processo que atendeu
+CAMINHO_METRICAS = os.environ.get('CDA_METRICAS_DIR')
+INTERVALO_METRICAS = float(os.environ.get('CDA_INTERVALO_METRICAS', '1'))
+# Perfil (cProfile) por requisição: 'desligado', 'cabecalho' (só requisições com o
+# cabeçalho X-Perfil) ou 'sempre'. Os .prof são gravados em dados/.cache/perfis/
+MODO_PERFIL = os.environ.get('CDA_PERFIL', 'desligado')
+CABECALHO_PERFIL = 'X-Perfil'
+CAMINHO_PERFIS = os.path.join(CAMINHO_CACHE, 'perfis')
+
+# Modo de carga dos CSVs: 'completo' (cada arquivo inteiro, em paralelo) ou 'streaming'
+# (em blocos, só as colunas usadas pelo app, gravados direto no snapshot em disco).
+# No streaming o pico de memória da leitura fica em torno de CDA_ORCAMENTO_CARGA_MB
+# (mais os valores distintos de texto e a contagem por fundo), qualquer que seja o nº
+# de linhas dos arquivos. Requer pyarrow
+MODO_CARGA = os.environ.get('CDA_MODO_CARGA', 'completo')
+ORCAMENTO_CARGA = int(os.environ.get('CDA_ORCAMENTO_CARGA_MB', '256')) * 2**20
+# Bytes em memória por byte de CSV lido pelo pandas (texto vira objetos Python)
+FATOR_MEMORIA_CSV = 8
+# Cópias de cada linha em memória ao ordenar uma faixa do snapshot (lida, reordenada
+# e codificada em dicionário) e máximo de faixas gravadas por passada pelas partições
+FATOR_MEMORIA_ORDENACAO = 4
+FAIXAS_ABERTAS_POR_PASSADA = 256
+
+# Leitura paralela dos CSVs: nº de processos (0 = um por núcleo)
+PROCESSOS_LEITURA = int(os.environ.get('CDA_PROCESSOS_LEITURA', '0'))
+# Bytes lidos do início de cada CSV para detectar a codificação
+TAMANHO_AMOSTRA_CODIFICACAO = 256 * 1024
 
 app = Flask(__name__)
 DF_UNICO = None 
+# Estruturas derivadas do DF_UNICO (índices, agregados...). O dicionário inteiro é
+# trocado de uma vez; a chave 'df' indica de qual DataFrame elas foram calculadas.
+DERIVADOS = {}
+# Tempo, linhas, codificação e erro de cada arquivo lido na última carga a partir dos CSVs
+RELATORIO_CARGA = []
+# Identidade (inode, mtime, tamanho) do snapshot carregado e pid do processo cuja
+# thread verifica se há um snapshot novo
+SNAPSHOT_CARREGADO = None
+VERIFICADOR_SNAPSHOT = None
+TRAVA_VERIFICADOR_SNAPSHOT = threading.Lock()
+# Assinatura (mtime/tamanho/hash por arquivo) dos CSVs que estão no DF_UNICO
+ASSINATURA_CARREGADA = None
+WATCHER = None
+# Métricas deste processo (cada worker do gunicorn tem as suas, ver CAMINHO_METRICAS):
+# (nome, rótulos) -> {'baldes', 'soma', 'contagem'} nos histogramas, valor nos contadores
+HISTOGRAMAS = {}
+CONTADORES = {}
+TRAVA_METRICAS = threading.Lock()
+# Arquivo de métricas deste processo em CAMINHO_METRICAS e pid da thread que o grava
+ARQUIVO_METRICAS = None
+GRAVADOR_METRICAS = None
+# (rota, fundo, versão) -> {codificação: corpo}, do menos para o mais usado
+CACHE_RESPOSTAS = OrderedDict()
+TAMANHO_CACHE_RESPOSTAS = 0
+TRAVA_CACHE_RESPOSTAS = threading.Lock()
+
+# Colunas numéricas dos arquivos CDA: quantidades e valores em float64,
+# percentuais/taxas (PR_*) em float32 (precisão de sobra para taxas)
+PREFIXOS_NUMERICOS = ('QT_', 'VL_', 'PR_')
+PREFIXOS_FLOAT32 = ('PR_',)
+# Texto com até esta fração de valores distintos é guardado como categórico
+LIMITE_CARDINALIDADE_CATEGORIA = 0.5
 
 # ----------------------------------------------------
 # MAPEAMENTO DE COLUNAS (Como você definiu)
@@ -33,40 +182,1564 @@ COLUNAS_FINAL_MAP = {
 }
 
 # ----------------------------------------------------
-# FUNÇÃO DE CARREGAMENTO DE DADOS (Inalterada)
+# MÉTRICAS E PERFIL POR REQUISIÇÃO
 # ----------------------------------------------------
-def carregar_dados_consolidados():
-    global DF_UNICO
-    if DF_UNICO is not None:
-        return DF_UNICO
+def _chave_metrica(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+def observar(nome, segundos, **rotulos):
+    """Registra uma duração no histograma 'nome' (com os rótulos informados)."""
+    chave = _chave_metrica(nome, rotulos)
+    with TRAVA_METRICAS:
+        serie = HISTOGRAMAS.get(chave)
+        if serie is None:
+            serie = HISTOGRAMAS[chave] = {'baldes': [0] * len(LIMITES_HISTOGRAMA), 'soma': 0.0, 'contagem': 0}
+        posicao = bisect_left(LIMITES_HISTOGRAMA, segundos)
+        if posicao < len(LIMITES_HISTOGRAMA):
+            serie['baldes'][posicao] += 1
+        serie['soma'] += segundos
+        serie['contagem'] += 1
+
+
+def contar(nome, valor=1, **rotulos):
+    """Incrementa o contador 'nome' (com os rótulos informados)."""
+    chave = _chave_metrica(nome, rotulos)
+    with TRAVA_METRICAS:
+        CONTADORES[chave] = CONTADORES.get(chave, 0) + valor
+
+
+@contextmanager
+def medir_etapa(etapa):
+    """Cronometra um trecho: vai para o histograma cda_etapa_segundos e, dentro de
+    uma requisição, para o cabeçalho Server-Timing da resposta."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        observar('cda_etapa_segundos', duracao, etapa=etapa)
+        if has_request_context():
+            g.setdefault('etapas', []).append((etapa, duracao))
+
+
+def _metricas_do_processo():
+    """Cópia (histogramas, contadores) das métricas deste processo."""
+    with TRAVA_METRICAS:
+        histogramas = {chave: dict(serie, baldes=list(serie['baldes'])) for chave, serie in HISTOGRAMAS.items()}
+        contadores = dict(CONTADORES)
+    # O cache de partições do histórico é um lru_cache: os números vêm dele
+    info = _abrir_particao.cache_info()
+    contadores[_chave_metrica('cda_cache_total', {'cache': 'particoes', 'resultado': 'acerto'})] = info.hits
+    contadores[_chave_metrica('cda_cache_total', {'cache': 'particoes', 'resultado': 'falha'})] = info.misses
+    return histogramas, contadores
 
-    lista_de_dataframes = []
-    codificacoes = ['latin-1', 'windows-1252']
 
-    for nome_arquivo in os.listdir(CAMINHO_PASTA):
+def gravar_metricas_processo():
+    """Grava as métricas deste processo no seu arquivo em CAMINHO_METRICAS (atômico).
+
+    O nome leva pid e hora de início: um worker novo que reaproveite o pid de um
+    encerrado não sobrescreve os contadores dele, que continuam somados.
+    """
+    global ARQUIVO_METRICAS
+    if ARQUIVO_METRICAS is None or ARQUIVO_METRICAS[0] != os.getpid():
+        ARQUIVO_METRICAS = (os.getpid(), os.path.join(CAMINHO_METRICAS, f'{os.getpid()}_{time.time_ns()}.json'))
+    histogramas, contadores = _metricas_do_processo()
+    conteudo = {
+        'histogramas': [[nome, rotulos, serie] for (nome, rotulos), serie in histogramas.items()],
+        'contadores': [[nome, rotulos, valor] for (nome, rotulos), valor in contadores.items()],
+    }
+    os.makedirs(CAMINHO_METRICAS, exist_ok=True)
+    temporario = _caminho_temporario(ARQUIVO_METRICAS[1])
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(conteudo, f)
+    os.replace(temporario, ARQUIVO_METRICAS[1])
+
+
+def _iniciar_gravador_metricas():
+    """Thread (uma por processo) que grava as métricas a cada INTERVALO_METRICAS segundos."""
+    global GRAVADOR_METRICAS
+    GRAVADOR_METRICAS = os.getpid()
+
+    def laco():
+        while True:
+            time.sleep(INTERVALO_METRICAS)
+            try:
+                gravar_metricas_processo()
+            except OSError as e:
+                print(f"⚠️ Não foi possível gravar as métricas do processo: {e}")
+
+    threading.Thread(target=laco, name='gravador-metricas', daemon=True).start()
+
+
+def _reiniciar_metricas_no_filho():
+    """Após o fork: o worker começa sem as métricas do mestre (já estão no arquivo dele)."""
+    global TRAVA_METRICAS, ARQUIVO_METRICAS, GRAVADOR_METRICAS
+    TRAVA_METRICAS = threading.Lock()
+    HISTOGRAMAS.clear()
+    CONTADORES.clear()
+    ARQUIVO_METRICAS = None
+    GRAVADOR_METRICAS = None
+
+
+if CAMINHO_METRICAS and hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_metricas_no_filho)
+
+
+def _metricas_de_todos_processos():
+    """Soma as métricas gravadas por todos os processos em CAMINHO_METRICAS."""
+    gravar_metricas_processo()
+    histogramas = {}
+    contadores = {}
+    for nome_arquivo in os.listdir(CAMINHO_METRICAS):
+        if not nome_arquivo.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(CAMINHO_METRICAS, nome_arquivo), encoding='utf-8') as f:
+                conteudo = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for nome, rotulos, serie in conteudo['histogramas']:
+            chave = (nome, tuple(map(tuple, rotulos)))
+            total = histogramas.setdefault(chave, {'baldes': [0] * len(LIMITES_HISTOGRAMA), 'soma': 0.0, 'contagem': 0})
+            total['baldes'] = [a + b for a, b in zip(total['baldes'], serie['baldes'])]
+            total['soma'] += serie['soma']
+            total['contagem'] += serie['contagem']
+        for nome, rotulos, valor in conteudo['contadores']:
+            chave = (nome, tuple(map(tuple, rotulos)))
+            contadores[chave] = contadores.get(chave, 0) + valor
+    return histogramas, contadores
+
+
+def _rotulos_prometheus(rotulos):
+    if not rotulos:
+        return ''
+    texto = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nome, valor in rotulos
+    )
+    return '{' + texto + '}'
+
+
+def _salvar_perfil(perfil):
+    """Grava o perfil da requisição atual (.prof, abra com pstats/snakeviz) e retorna o nome."""
+    os.makedirs(CAMINHO_PERFIS, exist_ok=True)
+    nome = f"{datetime.now():%Y%m%d_%H%M%S_%f}_{request.endpoint or 'requisicao'}.prof"
+    perfil.dump_stats(os.path.join(CAMINHO_PERFIS, nome))
+    print(f"🔬 Perfil de {request.method} {request.path} gravado em {os.path.join(CAMINHO_PERFIS, nome)}")
+    return nome
+
+
+@app.before_request
+def _iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    if CAMINHO_METRICAS and GRAVADOR_METRICAS != os.getpid():
+        with TRAVA_METRICAS:
+            if GRAVADOR_METRICAS != os.getpid():
+                _iniciar_gravador_metricas()
+    if MODO_PERFIL == 'sempre' or (MODO_PERFIL == 'cabecalho' and request.headers.get(CABECALHO_PERFIL)):
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Outro perfil já ativo (requisição concorrente): esta segue sem perfil
+            return
+        g.perfil = perfil
+
+
+@app.after_request
+def _registrar_medicao(resposta):
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfil.disable()
+        resposta.headers['X-Perfil-Arquivo'] = _salvar_perfil(perfil)
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+        observar('cda_requisicao_segundos', time.perf_counter() - inicio, rota=rota, metodo=request.method)
+        contar('cda_requisicoes_total', rota=rota, metodo=request.method, status=str(resposta.status_code))
+    etapas = g.pop('etapas', None)
+    if etapas:
+        resposta.headers['Server-Timing'] = ', '.join(f'{nome};dur={duracao * 1000:.2f}' for nome, duracao in etapas)
+    return resposta
+
+
+# ----------------------------------------------------
+# FUNÇÕES DE LEITURA DOS CSVs
+# ----------------------------------------------------
+def _identificar_particao(nome_arquivo):
+    """(mês AAAAMM, bloco 'BLC_n') a partir do nome do arquivo; None se fora do padrão."""
+    encontrado = PADRAO_ARQUIVO_CDA.match(nome_arquivo)
+    if not encontrado:
+        return None
+    return encontrado.group(2), f'BLC_{encontrado.group(1)}'
+
+
+def _listar_arquivos_csv():
+    """Lista (ordenada) dos CSVs da pasta de dados que devem ser consolidados.
+
+    Se houver mais de um mês em dados/, só o mais recente entra no DF_UNICO
+    (os anteriores são consultados pelo histórico).
+    """
+    arquivos = []
+    for nome_arquivo in sorted(os.listdir(CAMINHO_PASTA)):
         caminho_completo = os.path.join(CAMINHO_PASTA, nome_arquivo)
-        
         if os.path.isfile(caminho_completo) and nome_arquivo.startswith(PREFIXO) and nome_arquivo.endswith('.csv'):
-            df_lido_sucesso = False
-            for encoding in codificacoes:
-                try:
-                    df_temp = pd.read_csv(caminho_completo, encoding=encoding, sep=';', decimal=',')
-                    df_temp['Arquivo_Origem'] = nome_arquivo
-                    lista_de_dataframes.append(df_temp)
-                    df_lido_sucesso = True
-                    break
-                except Exception:
-                    continue
-            if not df_lido_sucesso:
-                print(f"❌ Erro: Não foi possível ler o arquivo {nome_arquivo}.")
+            arquivos.append(nome_arquivo)
+
+    meses = {particao[0] for particao in map(_identificar_particao, arquivos) if particao}
+    if len(meses) > 1:
+        mais_recente = max(meses)
+        arquivos = [a for a in arquivos if (_identificar_particao(a) or (mais_recente,))[0] == mais_recente]
+    return arquivos
+
+
+def _detectar_codificacao(caminho):
+    """Detecta a codificação a partir de uma amostra do início do arquivo."""
+    with open(caminho, 'rb') as f:
+        amostra = f.read(TAMANHO_AMOSTRA_CODIFICACAO)
+    if amostra.isascii():
+        # Sem acentos na amostra não há como distinguir: latin-1 é o padrão da CVM
+        return 'latin-1'
+    try:
+        amostra.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A amostra pode ter cortado um caractere de vários bytes no final
+        if e.reason == 'unexpected end of data':
+            return 'utf-8'
+    # 0x80-0x9F são controles em latin-1, mas aspas/travessões/€ em windows-1252
+    if any(0x80 <= byte <= 0x9F for byte in amostra):
+        try:
+            amostra.decode('windows-1252')
+            return 'windows-1252'
+        except UnicodeDecodeError:
+            pass
+    return 'latin-1'
+
+
+def _ler_arquivo_csv(caminho_completo):
+    """Lê um CSV da CVM. Roda em um processo do pool, por isso devolve (df, relatório) sem imprimir."""
+    nome_arquivo = os.path.basename(caminho_completo)
+    inicio = time.perf_counter()
+    relatorio = {'arquivo': nome_arquivo, 'codificacao': None, 'linhas': 0, 'segundos': 0.0, 'erro': None}
+    try:
+        encoding = _detectar_codificacao(caminho_completo)
+        try:
+            df_temp = pd.read_csv(caminho_completo, encoding=encoding, sep=';', decimal=',')
+        except UnicodeDecodeError:
+            # Amostra enganosa (acento só depois dela): latin-1 decodifica qualquer byte
+            encoding = 'latin-1'
+            df_temp = pd.read_csv(caminho_completo, encoding=encoding, sep=';', decimal=',')
+        df_temp['Arquivo_Origem'] = nome_arquivo
+        relatorio['codificacao'] = encoding
+        relatorio['linhas'] = len(df_temp)
+    except Exception as e:
+        df_temp = None
+        relatorio['erro'] = str(e)
+    relatorio['segundos'] = time.perf_counter() - inicio
+    return df_temp, relatorio
+
+
+def _colunas_do_csv(caminho_completo):
+    """Colunas do cabeçalho do CSV (lê só a primeira linha)."""
+    try:
+        return list(pd.read_csv(caminho_completo, encoding=_detectar_codificacao(caminho_completo), sep=';', nrows=0).columns)
+    except UnicodeDecodeError:
+        return list(pd.read_csv(caminho_completo, encoding='latin-1', sep=';', nrows=0).columns)
+
+
+def _ler_csvs(arquivos):
+    """Lê (em paralelo) e concatena os CSVs informados."""
+    global RELATORIO_CARGA
+    caminhos = [os.path.join(CAMINHO_PASTA, nome_arquivo) for nome_arquivo in arquivos]
+    processos = min(len(caminhos), PROCESSOS_LEITURA or os.cpu_count() or 1)
+
+    inicio = time.perf_counter()
+    if processos > 1:
+        # Os arquivos BLC são independentes: um processo por arquivo (ordem preservada pelo map)
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            resultados = list(executor.map(_ler_arquivo_csv, caminhos))
+    else:
+        resultados = [_ler_arquivo_csv(caminho) for caminho in caminhos]
+
+    lista_de_dataframes = []
+    RELATORIO_CARGA = []
+    for df_temp, relatorio in resultados:
+        RELATORIO_CARGA.append(relatorio)
+        if df_temp is None:
+            print(f"❌ Erro: Não foi possível ler o arquivo {relatorio['arquivo']}: {relatorio['erro']}")
+            continue
+        print(f"📄 {relatorio['arquivo']}: {relatorio['linhas']} linhas em {relatorio['segundos']:.2f}s ({relatorio['codificacao']})")
+        lista_de_dataframes.append(df_temp)
 
     if not lista_de_dataframes:
         raise Exception("Nenhum arquivo CSV compatível encontrado na pasta.")
+    print(f"⏱️ {len(lista_de_dataframes)} arquivo(s) lido(s) em {time.perf_counter() - inicio:.2f}s com {processos} processo(s)")
+
+    # Um único concat sobre a lista: cada coluna final é alocada uma vez só
+    df = pd.concat(lista_de_dataframes, ignore_index=True)
+    return _ordenar_por_fundo(df)
+
+
+def _ler_csvs_tipados(arquivos):
+    """_ler_csvs + _normalizar_tipos, cada etapa cronometrada."""
+    with medir_etapa('ler_csvs'):
+        df = _ler_csvs(arquivos)
+    with medir_etapa('normalizar_tipos'):
+        return _normalizar_tipos(df)
+
+
+def _ordenar_por_fundo(df):
+    """Remove linhas sem fundo e deixa as linhas de cada fundo contíguas (ver _indexar_fundos)."""
+    df = df.dropna(subset=[COLUNA_FILTRO])
+    colunas_ordem = [c for c in [COLUNA_FILTRO, 'CNPJ_FUNDO_CLASSE'] if c in df.columns]
+    return df.sort_values(colunas_ordem, kind='stable').reset_index(drop=True)
+
+
+# ----------------------------------------------------
+# SNAPSHOT COLUNAR EM DISCO (Arrow IPC)
+# ----------------------------------------------------
+def _hash_arquivo(caminho):
+    """SHA-1 do conteúdo do arquivo, lido em blocos de 1 MB."""
+    h = hashlib.sha1()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _assinar_arquivos(arquivos, manifesto_anterior=None):
+    """Retorna mtime, tamanho e hash de cada CSV.
+
+    O hash só é recalculado quando mtime ou tamanho mudaram em relação ao manifesto anterior.
+    """
+    anteriores = (manifesto_anterior or {}).get('arquivos', {})
+    assinatura = {}
+    for nome_arquivo in arquivos:
+        caminho_completo = os.path.join(CAMINHO_PASTA, nome_arquivo)
+        st = os.stat(caminho_completo)
+        anterior = anteriores.get(nome_arquivo)
+        if anterior and anterior['mtime'] == st.st_mtime and anterior['tamanho'] == st.st_size:
+            sha1 = anterior['sha1']
+        else:
+            sha1 = _hash_arquivo(caminho_completo)
+        assinatura[nome_arquivo] = {'mtime': st.st_mtime, 'tamanho': st.st_size, 'sha1': sha1}
+    return assinatura
+
+
+def _ler_manifesto():
+    try:
+        with open(ARQUIVO_MANIFESTO, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _snapshot_valido(manifesto, assinatura):
+    """O snapshot vale se a versão e o modo de carga batem e todos os CSVs têm o mesmo tamanho e hash."""
+    if not manifesto or manifesto.get('versao') != VERSAO_SNAPSHOT:
+        return False
+    # O snapshot do modo streaming só tem as colunas usadas pelo app
+    if manifesto.get('modo', 'completo') != MODO_CARGA:
+        return False
+    if not os.path.isfile(ARQUIVO_SNAPSHOT):
+        return False
+    anteriores = manifesto.get('arquivos', {})
+    if set(anteriores) != set(assinatura):
+        return False
+    return all(
+        anteriores[nome]['tamanho'] == info['tamanho'] and anteriores[nome]['sha1'] == info['sha1']
+        for nome, info in assinatura.items()
+    )
+
+
+def _versao_dados(assinatura):
+    """Versão do dataset: muda sempre que o conteúdo de algum CSV (ou o schema) muda."""
+    conteudo = json.dumps({nome: info['sha1'] for nome, info in assinatura.items()}, sort_keys=True)
+    return hashlib.sha1(f'{VERSAO_SNAPSHOT}|{conteudo}'.encode('utf-8')).hexdigest()[:16]
+
+
+def _data_dos_dados(assinatura):
+    """Data de modificação mais recente entre os CSVs (igual em todos os workers)."""
+    if not assinatura:
+        return datetime.now(timezone.utc).replace(microsecond=0)
+    return datetime.fromtimestamp(int(max(info['mtime'] for info in assinatura.values())), timezone.utc)
+
+
+def _caminho_temporario(caminho, sufixo='.tmp'):
+    """Temporário exclusivo do processo/thread: workers gravando o mesmo arquivo não colidem."""
+    return f'{caminho}.{os.getpid()}_{threading.get_ident()}{sufixo}'
+
+
+def _gravar_manifesto(assinatura):
+    temporario = _caminho_temporario(ARQUIVO_MANIFESTO)
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump({'versao': VERSAO_SNAPSHOT, 'modo': MODO_CARGA, 'arquivos': assinatura}, f, indent=1)
+    os.replace(temporario, ARQUIVO_MANIFESTO)
+
+
+def _converter_numero_cvm(serie):
+    """Converte uma coluna numérica CVM para float64 de forma vetorizada.
+
+    Aceita tanto '1234.56' quanto o formato brasileiro '1.234,56'; valores já numéricos
+    (lidos pelo read_csv) são mantidos como estão.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype('float64')
+    texto = serie.astype('string').str.strip()
+    formato_br = texto.str.contains(',', regex=False, na=False)
+    texto = texto.mask(formato_br, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    numeros = pd.to_numeric(texto, errors='coerce')
+    return pd.Series(numeros.to_numpy(dtype='float64', na_value=np.nan), index=serie.index, name=serie.name)
+
+
+def _normalizar_tipos(df):
+    """Aplica o schema de tipos uma única vez na carga, compactando o DF em memória.
+
+    - QT_*/VL_* viram float64 e PR_* float32;
+    - colunas totalmente vazias (sobras do concat entre layouts de BLC) são descartadas;
+    - texto repetitivo (TP_APLIC, DENOM_SOCIAL, EMISSOR...) vira categórico;
+    - outras colunas numéricas inteiras são reduzidas ao menor tipo inteiro.
+    """
+    obrigatorias = set(COLUNAS_FINAL_MAP) | {COLUNA_FILTRO}
+    vazias = [c for c in df.columns if c not in obrigatorias and df[c].isna().all()]
+    df = df.drop(columns=vazias)
+
+    colunas = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        if coluna.startswith(PREFIXOS_NUMERICOS):
+            serie = _converter_numero_cvm(serie)
+            if coluna.startswith(PREFIXOS_FLOAT32):
+                serie = serie.astype('float32')
+        elif pd.api.types.is_numeric_dtype(serie):
+            if not serie.isna().any() and (serie % 1 == 0).all():
+                serie = pd.to_numeric(serie, downcast='integer')
+        else:
+            if isinstance(serie.dtype, pd.StringDtype) and serie.dtype.na_value is pd.NA:
+                # Texto já compactado ('string', recarga incremental): volta ao tipo de texto
+                # do read_csv, para ficar igual ao de uma carga completa
+                serie = pd.Series(serie.to_numpy(dtype=object, na_value=np.nan), index=serie.index, name=serie.name)
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                # Já categórico (recarga incremental): tira as categorias de linhas que saíram
+                serie = serie.cat.remove_unused_categories()
+            distintos = serie.nunique(dropna=True)
+            if distintos <= max(1, len(serie) * LIMITE_CARDINALIDADE_CATEGORIA):
+                serie = serie.astype('category')
+            else:
+                serie = serie.astype('string')
+        colunas[coluna] = serie
+    return pd.DataFrame(colunas, index=df.index)
+
+
+def relatorio_memoria(df):
+    """Bytes ocupados por coluna (memória real, incluindo o texto), do maior para o menor."""
+    uso = df.memory_usage(index=False, deep=True)
+    relatorio = pd.DataFrame({'tipo': df.dtypes.astype(str), 'bytes': uso})
+    return relatorio.sort_values('bytes', ascending=False)
+
 
-    DF_UNICO = pd.concat(lista_de_dataframes, ignore_index=True)
-    DF_UNICO = DF_UNICO.dropna(subset=[COLUNA_FILTRO]) 
+def _gravar_arrow(df, caminho, versao=None):
+    """Grava o DF como Arrow IPC sem compressão, de forma atômica (temporário + os.replace).
+
+    Colunas float são gravadas com NaN (e não como nulos do Arrow): assim a leitura
+    mapeada em memória devolve arrays NumPy que apontam direto para o arquivo (zero-copy).
+    """
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    for posicao, coluna in enumerate(tabela.column_names):
+        if df[coluna].dtype.kind == 'f':
+            tabela = tabela.set_column(posicao, coluna, pa.array(df[coluna].to_numpy(), from_pandas=False))
+    if versao:
+        # A versão vai dentro do próprio arquivo: troca de dados e de versão são atômicas
+        tabela = tabela.replace_schema_metadata({**tabela.schema.metadata, b'versao_dados': versao.encode()})
+    temporario = _caminho_temporario(caminho)
+    feather.write_feather(tabela, temporario, compression='uncompressed')
+    os.replace(temporario, caminho)
+
+
+def _abrir_arrow(caminho):
+    """Tabela Arrow mapeada em memória: as páginas do arquivo são compartilhadas entre processos."""
+    return pa.ipc.open_file(pa.memory_map(caminho, 'r')).read_all()
+
+
+def _identidade_arquivo(caminho):
+    st = os.stat(caminho)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _gravar_snapshot(df, assinatura):
+    """Grava o snapshot e o manifesto de forma atômica (arquivo temporário + os.replace)."""
+    global SNAPSHOT_CARREGADO
+    os.makedirs(CAMINHO_CACHE, exist_ok=True)
+    _gravar_arrow(df, ARQUIVO_SNAPSHOT, _versao_dados(assinatura))
+    _gravar_manifesto(assinatura)
+    SNAPSHOT_CARREGADO = _identidade_arquivo(ARQUIVO_SNAPSHOT)
+
+
+def _ler_snapshot():
+    """Retorna (df, versão dos dados) do snapshot."""
+    global SNAPSHOT_CARREGADO
+    identidade = _identidade_arquivo(ARQUIVO_SNAPSHOT)
+    tabela = _abrir_arrow(ARQUIVO_SNAPSHOT)
+    versao = (tabela.schema.metadata or {}).get(b'versao_dados', b'').decode() or None
+    # split_blocks: um bloco por coluna, sem consolidar (o que forçaria uma cópia)
+    df = tabela.to_pandas(split_blocks=True)
+    SNAPSHOT_CARREGADO = identidade
+    return df, versao
+
+
+def construir_snapshot():
+    """Etapa de build: converte os CSVs da pasta em um snapshot colunar tipado."""
+    if pa is None:
+        raise Exception("O pacote 'pyarrow' é necessário para gerar o snapshot.")
+    arquivos = _listar_arquivos_csv()
+    assinatura = _assinar_arquivos(arquivos, _ler_manifesto())
+    if MODO_CARGA == 'streaming':
+        return _carregar_em_streaming(arquivos, assinatura)
+    df = _ler_csvs_tipados(arquivos)
+    _gravar_snapshot(df, assinatura)
+    return df
+
+
+# ----------------------------------------------------
+# CARGA EM STREAMING (pico de memória limitado por ORCAMENTO_CARGA)
+# ----------------------------------------------------
+def _colunas_streaming():
+    """Colunas que o app usa: as únicas lidas no modo streaming."""
+    colunas = [COLUNA_FILTRO, 'CNPJ_FUNDO_CLASSE', *COLUNAS_FINAL_MAP, 'QT_POS_FINAL', *COLUNAS_CHAVE_POSICAO]
+    for chaves in COLUNAS_EXPOSICAO.values():
+        colunas += chaves
+    return [c for c in dict.fromkeys(colunas) if c != 'Perc_Pos_Final']
+
+
+def _schema_streaming():
+    """Schema fixo das partições: mesmos tipos numéricos de _normalizar_tipos, o resto texto."""
+    campos = []
+    for coluna in _colunas_streaming():
+        if coluna.startswith(PREFIXOS_FLOAT32):
+            tipo = pa.float32()
+        elif coluna.startswith(PREFIXOS_NUMERICOS):
+            tipo = pa.float64()
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(coluna, tipo))
+    return pa.schema(campos + [pa.field('Arquivo_Origem', pa.string())])
+
+
+def _linhas_por_bloco(bytes_por_linha):
+    return max(1_000, int(ORCAMENTO_CARGA / max(1.0, bytes_por_linha)))
+
+
+def _bloco_para_arrow(bloco, schema, nome_arquivo):
+    """Converte um bloco do read_csv (tudo texto) para uma tabela Arrow no schema fixo."""
+    arrays = []
+    for campo in schema:
+        if campo.name == 'Arquivo_Origem':
+            arrays.append(pa.repeat(pa.scalar(nome_arquivo, pa.string()), len(bloco)))
+            continue
+        # Coluna ausente neste layout de BLC: vai inteira como vazia
+        serie = bloco[campo.name] if campo.name in bloco.columns else pd.Series(None, index=bloco.index, dtype=object)
+        if pa.types.is_floating(campo.type):
+            # NaN (e não nulo do Arrow), como em _gravar_arrow: leitura zero-copy depois
+            valores = _converter_numero_cvm(serie).to_numpy(dtype=campo.type.to_pandas_dtype())
+            arrays.append(pa.array(valores, type=campo.type, from_pandas=False))
+        else:
+            # Texto do pandas já em Arrow pode vir em vários pedaços (ChunkedArray)
+            arrays.append(pa.array(serie, type=pa.string(), from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _gravar_particao_streaming(caminho_csv, caminho_particao, schema, encoding):
+    """Lê o CSV em blocos e grava cada bloco na partição Arrow.
+
+    Retorna o nº de linhas e as colunas do schema que existem no cabeçalho do arquivo.
+    """
+    nome_arquivo = os.path.basename(caminho_csv)
+    with open(caminho_csv, 'rb') as f:
+        amostra = f.read(TAMANHO_AMOSTRA_CODIFICACAO)
+    bytes_por_linha = len(amostra) / max(1, amostra.count(b'\n')) * FATOR_MEMORIA_CSV
+    colunas = set(schema.names)
+    cabecalho = pd.read_csv(caminho_csv, encoding=encoding, sep=';', nrows=0).columns
+    linhas = 0
+    leitor = pd.read_csv(caminho_csv, encoding=encoding, sep=';', dtype=str,
+                         usecols=lambda coluna: coluna in colunas,
+                         chunksize=_linhas_por_bloco(bytes_por_linha))
+    with leitor, pa.OSFile(caminho_particao, 'wb') as destino, pa.ipc.new_file(destino, schema) as escritor:
+        for bloco in leitor:
+            escritor.write_table(_bloco_para_arrow(bloco, schema, nome_arquivo))
+            linhas += len(bloco)
+    return linhas, colunas.intersection(cabecalho)
+
+
+def _ler_csv_streaming(caminho_csv, caminho_particao, schema):
+    """Versão em blocos de _ler_arquivo_csv: grava a partição e devolve o relatório."""
+    inicio = time.perf_counter()
+    relatorio = {'arquivo': os.path.basename(caminho_csv), 'codificacao': None, 'linhas': 0, 'segundos': 0.0,
+                 'erro': None, 'colunas': set()}
+    try:
+        encoding = _detectar_codificacao(caminho_csv)
+        try:
+            relatorio['linhas'], relatorio['colunas'] = _gravar_particao_streaming(caminho_csv, caminho_particao, schema, encoding)
+        except UnicodeDecodeError:
+            # Acento só depois da amostra: regrava a partição inteira em latin-1
+            encoding = 'latin-1'
+            relatorio['linhas'], relatorio['colunas'] = _gravar_particao_streaming(caminho_csv, caminho_particao, schema, encoding)
+        relatorio['codificacao'] = encoding
+    except Exception as e:
+        relatorio['erro'] = str(e)
+    relatorio['segundos'] = time.perf_counter() - inicio
+    return relatorio
+
+
+def _dicionario_ordenado(coluna):
+    """Valores distintos (sem nulos) da coluna, ordenados como o pandas ordena as categorias."""
+    distintos = pc.unique(coluna).drop_null()
+    return distintos.take(pc.array_sort_indices(distintos))
+
+
+def _coluna_vazia(coluna):
+    if coluna.null_count == len(coluna):
+        return True
+    return pa.types.is_floating(coluna.type) and pc.all(pc.is_nan(coluna.fill_null(float('nan')))).as_py()
+
+
+def _ler_lotes(caminho):
+    """Lotes de um arquivo Arrow, um de cada vez (lidos, sem mapear o arquivo inteiro)."""
+    with pa.OSFile(caminho, 'rb') as origem:
+        leitor = pa.ipc.open_file(origem)
+        for posicao in range(leitor.num_record_batches):
+            yield leitor.get_batch(posicao)
+            # O pool do Arrow retém a memória dos lotes já usados: devolve ao sistema
+            pa.default_memory_pool().release_unused()
+
+
+def _resumir_particoes(partes, limite_bytes_dicionario):
+    """Primeira passada pelas partições: o que é preciso saber antes de ordenar.
+
+    Devolve o total de linhas, as linhas de cada fundo, as colunas com algum valor e
+    os valores distintos de cada coluna de texto (None na coluna cujos distintos
+    passem de 'limite_bytes_dicionario': ela fica como texto, sem dicionário).
+    """
+    total = 0
+    contagens = {}
+    nao_vazias = set()
+    distintos = {}
+    for parte in partes:
+        for lote in _ler_lotes(parte):
+            total += lote.num_rows
+            quantidades = pc.value_counts(lote.column(COLUNA_FILTRO))
+            for fundo, quantidade in zip(quantidades.field('values').to_pylist(), quantidades.field('counts').to_pylist()):
+                if fundo is not None:
+                    contagens[fundo] = contagens.get(fundo, 0) + quantidade
+            for campo, coluna in zip(lote.schema, lote.columns):
+                if not _coluna_vazia(coluna):
+                    nao_vazias.add(campo.name)
+                if not pa.types.is_string(campo.type) or distintos.get(campo.name, ()) is None:
+                    continue
+                valores = pc.unique(coluna).drop_null()
+                if campo.name in distintos:
+                    valores = pc.unique(pa.concat_arrays([distintos[campo.name], valores]))
+                distintos[campo.name] = valores if valores.nbytes <= limite_bytes_dicionario else None
+    return total, contagens, nao_vazias, distintos
+
+
+def _dividir_em_faixas(contagens, linhas_por_faixa):
+    """Fundos em ordem e a posição (nessa ordem) do primeiro fundo de cada faixa.
+
+    Cada faixa junta fundos consecutivos até somar 'linhas_por_faixa' linhas (um fundo
+    maior que isso fica sozinho numa faixa).
+    """
+    fundos = _dicionario_ordenado(pa.array(list(contagens), pa.string()))
+    inicios = [0]
+    acumulado = 0
+    for posicao, fundo in enumerate(fundos.to_pylist()):
+        if acumulado and acumulado + contagens[fundo] > linhas_por_faixa:
+            inicios.append(posicao)
+            acumulado = 0
+        acumulado += contagens[fundo]
+    return fundos, np.asarray(inicios)
+
+
+def _distribuir_em_faixas(partes, fundos, inicios, pasta):
+    """Segunda passada: copia as linhas de cada faixa de fundos para um arquivo próprio.
+
+    As linhas mantêm a ordem original (arquivo a arquivo); as sem fundo são
+    descartadas. Com muitas faixas, as partições são relidas a cada
+    FAIXAS_ABERTAS_POR_PASSADA faixas (limite de arquivos abertos).
+    """
+    caminhos = [os.path.join(pasta, f'faixa_{numero}.arrow') for numero in range(len(inicios))]
+    for primeira in range(0, len(caminhos), FAIXAS_ABERTAS_POR_PASSADA):
+        ultima = min(primeira + FAIXAS_ABERTAS_POR_PASSADA, len(caminhos))
+        escritores = {}
+        try:
+            for parte in partes:
+                for lote in _ler_lotes(parte):
+                    posicoes = pc.index_in(lote.column(COLUNA_FILTRO), value_set=fundos).fill_null(-1).to_numpy()
+                    faixas = np.searchsorted(inicios, posicoes, side='right') - 1
+                    selecionadas = np.flatnonzero((faixas >= primeira) & (faixas < ultima))
+                    selecionadas = selecionadas[np.argsort(faixas[selecionadas], kind='stable')]
+                    faixas = faixas[selecionadas]
+                    lote = lote.take(pa.array(selecionadas))
+                    cortes = np.flatnonzero(np.diff(faixas)) + 1
+                    for inicio, fim in zip(np.concatenate(([0], cortes)), np.concatenate((cortes, [len(faixas)]))):
+                        if fim <= inicio:
+                            continue
+                        numero = int(faixas[inicio])
+                        if numero not in escritores:
+                            escritores[numero] = pa.ipc.new_file(pa.OSFile(caminhos[numero], 'wb'), lote.schema)
+                        escritores[numero].write_batch(lote.slice(inicio, fim - inicio))
+        finally:
+            for escritor in escritores.values():
+                escritor.close()
+    return caminhos
+
+
+def _consolidar_particoes(partes, caminho, versao, presentes):
+    """Junta as partições no snapshot final, ordenado por fundo, com memória limitada.
+
+    Ordenação externa por faixas de fundos, sem nunca ter o snapshot inteiro em
+    memória: (1) uma passada conta as linhas de cada fundo e os valores distintos do
+    texto; (2) os fundos, em ordem, são divididos em faixas de até ORCAMENTO_CARGA
+    (ver FATOR_MEMORIA_ORDENACAO) e as linhas de cada faixa copiadas para um
+    arquivo; (3) cada faixa é ordenada e gravada no snapshot, lote a lote.
+
+    Texto repetitivo vira dicionário ordenado (categórico no pandas), como em
+    _normalizar_tipos; coluna cujos distintos não cabem no orçamento de uma faixa
+    fica como texto. Também como lá, saem as colunas totalmente vazias (as obrigatórias só se
+    não estiverem em nenhum arquivo, ver 'presentes').
+    """
+    with pa.OSFile(partes[0], 'rb') as origem:
+        schema = pa.ipc.open_file(origem).schema
+    total, contagens, nao_vazias, distintos = _resumir_particoes(partes, ORCAMENTO_CARGA / FATOR_MEMORIA_ORDENACAO)
+    bytes_por_linha = sum(os.path.getsize(parte) for parte in partes) / max(1, total)
+    linhas_por_faixa = max(1_000, int(ORCAMENTO_CARGA / (bytes_por_linha * FATOR_MEMORIA_ORDENACAO)))
+    validas = sum(contagens.values())
+
+    obrigatorias = set(COLUNAS_FINAL_MAP) | {COLUNA_FILTRO}
+    campos, dicionarios = [], {}
+    for campo in schema:
+        if campo.name not in presentes or (campo.name not in obrigatorias and campo.name not in nao_vazias):
+            continue
+        dicionario = distintos.get(campo.name)
+        if dicionario is not None and len(dicionario) <= max(1, validas * LIMITE_CARDINALIDADE_CATEGORIA):
+            dicionarios[campo.name] = dicionario.take(pc.array_sort_indices(dicionario))
+            campo = pa.field(campo.name, pa.dictionary(pa.int32(), campo.type))
+        campos.append(campo)
+    schema_final = pa.schema(campos, metadata={b'versao_dados': versao.encode()})
+    del distintos
+
+    # Ordenação estável, como em _ordenar_por_fundo (linhas sem fundo descartadas)
+    chaves = [(c, 'ascending', 'at_end') for c in [COLUNA_FILTRO, 'CNPJ_FUNDO_CLASSE'] if c in schema.names]
+    fundos, inicios = _dividir_em_faixas(contagens, linhas_por_faixa)
+    del contagens
+    pasta_faixas = os.path.join(os.path.dirname(partes[0]), 'faixas')
+    os.makedirs(pasta_faixas, exist_ok=True)
+    temporario = _caminho_temporario(caminho)
+    try:
+        faixas = _distribuir_em_faixas(partes, fundos, inicios, pasta_faixas)
+        with pa.OSFile(temporario, 'wb') as destino, pa.ipc.new_file(destino, schema_final) as escritor:
+            for caminho_faixa in faixas:
+                if not os.path.exists(caminho_faixa):
+                    # Faixa sem linhas (ex.: nenhum fundo nos arquivos)
+                    continue
+                tabela = pa.Table.from_batches(list(_ler_lotes(caminho_faixa)), schema=schema)
+                os.remove(caminho_faixa)
+                tabela = tabela.take(pc.sort_indices(tabela, sort_keys=chaves))
+                arrays = []
+                for campo in schema_final:
+                    coluna = tabela.column(campo.name).combine_chunks()
+                    if campo.name in dicionarios:
+                        indices = pc.index_in(coluna, value_set=dicionarios[campo.name])
+                        coluna = pa.DictionaryArray.from_arrays(indices, dicionarios[campo.name])
+                    arrays.append(coluna)
+                escritor.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema_final))
+                del tabela, arrays
+                pa.default_memory_pool().release_unused()
+        os.replace(temporario, caminho)
+    finally:
+        shutil.rmtree(pasta_faixas, ignore_errors=True)
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return validas
+
+
+def construir_snapshot_streaming(arquivos, assinatura):
+    """Grava o snapshot a partir dos CSVs sem carregá-los inteiros na memória.
+
+    Cada CSV é lido em blocos (só as colunas de _colunas_streaming, com schema fixo)
+    e gravado numa partição Arrow em disco; depois as partições viram o snapshot.
+    O DF é então aberto pelo caminho normal (_ler_snapshot, mapeado em memória).
+    """
+    global RELATORIO_CARGA
+    schema = _schema_streaming()
+    pasta_particoes = os.path.join(CAMINHO_CACHE, 'streaming')
+    os.makedirs(pasta_particoes, exist_ok=True)
+    inicio = time.perf_counter()
+    RELATORIO_CARGA = []
+    partes = []
+    presentes = {'Arquivo_Origem'}
+    try:
+        for nome_arquivo in arquivos:
+            caminho_particao = os.path.join(pasta_particoes, nome_arquivo + '.arrow')
+            relatorio = _ler_csv_streaming(os.path.join(CAMINHO_PASTA, nome_arquivo), caminho_particao, schema)
+            RELATORIO_CARGA.append(relatorio)
+            if relatorio['erro']:
+                print(f"❌ Erro: Não foi possível ler o arquivo {nome_arquivo}: {relatorio['erro']}")
+                continue
+            print(f"📄 {nome_arquivo}: {relatorio['linhas']} linhas em {relatorio['segundos']:.2f}s ({relatorio['codificacao']}, em blocos)")
+            partes.append(caminho_particao)
+            presentes |= relatorio['colunas']
+
+        if not partes:
+            raise Exception("Nenhum arquivo CSV compatível encontrado na pasta.")
+        linhas = _consolidar_particoes(partes, ARQUIVO_SNAPSHOT, _versao_dados(assinatura), presentes)
+        _gravar_manifesto(assinatura)
+    finally:
+        shutil.rmtree(pasta_particoes, ignore_errors=True)
+    print(f"⏱️ {len(partes)} arquivo(s) lido(s) em blocos em {time.perf_counter() - inicio:.2f}s ({linhas} linhas)")
+
+
+def _carregar_em_streaming(arquivos, assinatura):
+    """Grava o snapshot em streaming e devolve o DF lido dele."""
+    with medir_etapa('ler_csvs_streaming'):
+        construir_snapshot_streaming(arquivos, assinatura)
+    with medir_etapa('ler_snapshot'):
+        df, _ = _ler_snapshot()
+    return df
+
+
+# ----------------------------------------------------
+# ESTRUTURAS DERIVADAS (calculadas uma vez por carga)
+# ----------------------------------------------------
+def _indexar_fundos(df):
+    """Mapeia cada fundo para o intervalo [início, fim) de suas linhas no DF ordenado."""
+    if df.empty:
+        return None
+    serie = df[COLUNA_FILTRO]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Categorias já vêm ordenadas: basta comparar os códigos inteiros
+        valores = serie.cat.codes.to_numpy()
+        nomes = serie.cat.categories
+    else:
+        valores = serie.to_numpy()
+        nomes = None
+    if not pd.Series(valores).is_monotonic_increasing:
+        return None
+    quebras = np.flatnonzero(valores[1:] != valores[:-1]) + 1
+    inicios = np.concatenate(([0], quebras))
+    fins = np.concatenate((quebras, [len(valores)]))
+    if nomes is not None:
+        return {nomes[valores[i]]: (int(i), int(f)) for i, f in zip(inicios, fins)}
+    return {valores[i]: (int(i), int(f)) for i, f in zip(inicios, fins)}
+
+
+def _listas_por_grupo(chaves, *colunas):
+    """Para chaves já agrupadas (contíguas), devolve {chave: (lista_col1, lista_col2, ...)}.
+
+    Valores ausentes viram None (null no JSON; NaN não é JSON válido).
+    """
+    chaves = np.asarray(chaves)
+    if len(chaves) == 0:
+        return {}
+    quebras = np.flatnonzero(chaves[1:] != chaves[:-1]) + 1
+    inicios = np.concatenate(([0], quebras)).tolist()
+    fins = np.concatenate((quebras, [len(chaves)])).tolist()
+    listas = []
+    for coluna in colunas:
+        valores = np.asarray(coluna, dtype=object)
+        valores[pd.isna(valores)] = None
+        listas.append(valores.tolist())
+    return {
+        chaves[i]: tuple(lista[i:f] for lista in listas)
+        for i, f in zip(inicios, fins)
+    }
+
+
+def _calcular_agregados(df):
+    """Dados dos gráficos de todos os fundos num único passe vetorizado.
+
+    Para cada fundo: top 10 ativos + "Outros", soma por TP_APLIC, total e nº de posições.
+    """
+    coluna_valor = 'VL_MERC_POS_FINAL'
+    if df.empty or coluna_valor not in df.columns:
+        return {}
+
+    fundos = df[COLUNA_FILTRO]
+    valores = df[coluna_valor].fillna(0)
+    resumo = valores.groupby(fundos, observed=True).agg(['sum', 'size'])
+    totais = valores.groupby(fundos, observed=True).transform('sum')
+    perc = (valores / totais * 100).where(totais != 0, 0.0)
+
+    agregados = {
+        fundo: {
+            'total': float(total),
+            'posicoes': int(posicoes),
+            'ativos': {"labels": [], "data": []},
+            'tipo': {"labels": [], "data": []},
+        }
+        for fundo, total, posicoes in zip(resumo.index, resumo['sum'], resumo['size'])
+    }
+
+    # Gráfico 1: top 10 por fundo (mesma ordem/desempate do nlargest) + "Outros"
+    if 'CD_ATIVO_BV_MERC' in df.columns:
+        base = pd.DataFrame({'fundo': fundos, 'ativo': df['CD_ATIVO_BV_MERC'], 'perc': perc})
+        base = base.sort_values(['fundo', 'perc'], ascending=[True, False], kind='stable')
+        no_top = base.groupby('fundo', observed=True).cumcount() < 10
+        outros = base.loc[~no_top, 'perc'].groupby(base.loc[~no_top, 'fundo'], observed=True).sum()
+        top = base[no_top]
+        for fundo, (labels, data) in _listas_por_grupo(top['fundo'].astype(object), top['ativo'], top['perc']).items():
+            agregados[fundo]['ativos'] = {
+                "labels": labels + ['Outros'],
+                "data": data + [float(outros.get(fundo, 0.0))],
+            }
+
+    # Gráfico 2: soma dos percentuais por Tipo de Aplicação
+    if 'TP_APLIC' in df.columns:
+        por_tipo = perc.groupby([fundos, df['TP_APLIC']], observed=True).sum().reset_index()
+        por_tipo.columns = ['fundo', 'tipo', 'perc']
+        for fundo, (labels, data) in _listas_por_grupo(por_tipo['fundo'].astype(object), por_tipo['tipo'], por_tipo['perc']).items():
+            agregados[fundo]['tipo'] = {"labels": labels, "data": data}
+
+    return agregados
+
+
+def _agregado_fundo(df_completo, fundo_escolhido):
+    """Agregados pré-calculados do fundo; None se não valem para este DF."""
+    derivados = DERIVADOS
+    if derivados.get('df') is not df_completo:
+        return None
+    return derivados.get('agregados', {}).get(fundo_escolhido)
+
+
+def _normalizar_busca(texto):
+    """Texto para busca: sem acentos, maiúsculo e com espaços simples."""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.upper().split())
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _indexar_busca(df):
+    """Índice de busca de fundos por DENOM_SOCIAL e CNPJ_FUNDO_CLASSE.
+
+    - 'prefixos': lista ordenada de (chave normalizada, id) para busca por prefixo (bisect);
+    - 'trigramas': trigrama -> ids (np.array ordenado) para busca por substring;
+    - 'chaves_fundo': chaves de cada id (nome normalizado e CNPJs), para confirmar a substring.
+    Chaves de CNPJ guardam só os dígitos, então '05.075' e '05075' encontram o mesmo fundo.
+    """
+    if df.empty:
+        return None
+    cnpjs = {}
+    if 'CNPJ_FUNDO_CLASSE' in df.columns:
+        pares = df[[COLUNA_FILTRO, 'CNPJ_FUNDO_CLASSE']].dropna().drop_duplicates()
+        for nome, cnpj in zip(pares[COLUNA_FILTRO].astype(str), pares['CNPJ_FUNDO_CLASSE'].astype(str)):
+            cnpjs.setdefault(nome, []).append(cnpj)
+    nomes = sorted(set(df[COLUNA_FILTRO].dropna().astype(str)))
+
+    fundos = []
+    chaves = []
+    chaves_por_fundo = []
+    postings = {}
+    for id_fundo, nome in enumerate(nomes):
+        cnpjs_fundo = sorted(cnpjs.get(nome, []))
+        fundos.append({"fundo": nome, "cnpj": cnpjs_fundo})
+        chaves_fundo = [_normalizar_busca(nome)] + [''.join(filter(str.isdigit, c)) for c in cnpjs_fundo]
+        chaves_por_fundo.append(chaves_fundo)
+        for chave in chaves_fundo:
+            chaves.append((chave, id_fundo))
+            for trigrama in _trigramas(chave):
+                postings.setdefault(trigrama, []).append(id_fundo)
+
+    chaves.sort()
+    return {
+        'fundos': fundos,
+        'prefixos': chaves,
+        'chaves_prefixo': [chave for chave, _ in chaves],
+        'trigramas': {t: np.unique(np.array(ids, dtype=np.int32)) for t, ids in postings.items()},
+        'chaves_fundo': chaves_por_fundo,
+    }
+
+
+def buscar_fundos(indice, consulta, limite):
+    """Fundos cujo nome/CNPJ começa com (ou contém) a consulta, ignorando acentos.
+
+    Resultados por prefixo vêm primeiro; depois os que contêm a consulta no meio.
+    """
+    consulta = _normalizar_busca(consulta)
+    if not indice or not consulta:
+        return []
+    consultas = [consulta]
+    digitos = ''.join(filter(str.isdigit, consulta))
+    if digitos and digitos != consulta:
+        consultas.append(digitos)
+
+    encontrados = []
+    vistos = set()
+
+    # 1. Prefixo: busca binária na lista ordenada de chaves
+    for termo in consultas:
+        posicao = bisect_left(indice['chaves_prefixo'], termo)
+        for chave, id_fundo in indice['prefixos'][posicao:]:
+            if not chave.startswith(termo) or len(encontrados) >= limite:
+                break
+            if id_fundo not in vistos:
+                vistos.add(id_fundo)
+                encontrados.append(id_fundo)
+
+    # 2. Substring: interseção das listas de trigramas, confirmada nas chaves do fundo
+    for termo in consultas:
+        if len(encontrados) >= limite or len(termo) < 3:
+            continue
+        listas = [indice['trigramas'].get(t) for t in _trigramas(termo)]
+        if any(lista is None for lista in listas):
+            continue
+        candidatos = listas[0]
+        for lista in sorted(listas[1:], key=len):
+            candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+        for id_fundo in candidatos.tolist():
+            if len(encontrados) >= limite:
+                break
+            if id_fundo not in vistos and any(termo in chave for chave in indice['chaves_fundo'][id_fundo]):
+                vistos.add(id_fundo)
+                encontrados.append(id_fundo)
+
+    return [indice['fundos'][id_fundo] for id_fundo in encontrados]
+
+
+def _chave_exposicao(valor):
+    """Chave normalizada de emissor/ativo; CPF/CNPJ ficam só com os dígitos."""
+    texto = _normalizar_busca(valor)
+    digitos = ''.join(filter(str.isdigit, texto))
+    if len(digitos) in (11, 14) and not any(c.isalpha() for c in texto):
+        return digitos
+    return texto
+
+
+def _indexar_exposicao(df):
+    """Índice invertido: tipo ('emissor'/'ativo') -> chave -> posições das linhas (np.int32).
+
+    Calculado sobre os códigos categóricos: cada valor distinto é normalizado uma única vez.
+    """
+    indice = {}
+    for tipo, colunas in COLUNAS_EXPOSICAO.items():
+        blocos = {}
+        for coluna in colunas:
+            if coluna not in df.columns:
+                continue
+            serie = df[coluna]
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                serie = serie.astype('category')
+            codigos = serie.cat.codes.to_numpy()
+            categorias = serie.cat.categories
+            ordem = np.argsort(codigos, kind='stable').astype(np.int32)
+            quebras = np.flatnonzero(np.diff(codigos[ordem])) + 1
+            for posicoes in np.split(ordem, quebras):
+                if len(posicoes) == 0 or codigos[posicoes[0]] < 0:
+                    continue
+                chave = _chave_exposicao(categorias[codigos[posicoes[0]]])
+                blocos.setdefault(chave, []).append(posicoes)
+        indice[tipo] = {
+            chave: partes[0] if len(partes) == 1 else np.unique(np.concatenate(partes))
+            for chave, partes in blocos.items()
+        }
+    return indice
+
+
+def consultar_exposicao(df_completo, tipo, chave, limite):
+    """Quais fundos detêm o emissor/ativo, quanto cada um detém e a concentração.
+
+    Retorna None se a chave não existir. Usa o índice invertido; sem ele (DF diferente
+    do publicado), calcula o índice na hora.
+    """
+    derivados = DERIVADOS
+    if derivados.get('df') is df_completo and 'exposicao' in derivados:
+        indice = derivados['exposicao']
+        agregados = derivados.get('agregados', {})
+    else:
+        indice = _indexar_exposicao(df_completo)
+        agregados = {}
+    posicoes = indice.get(tipo, {}).get(_chave_exposicao(chave))
+    if posicoes is None or 'VL_MERC_POS_FINAL' not in df_completo.columns:
+        return None
+
+    linhas = df_completo.iloc[posicoes]
+    valores = linhas['VL_MERC_POS_FINAL'].fillna(0)
+    por_fundo = valores.groupby(linhas[COLUNA_FILTRO], observed=True).sum().sort_values(ascending=False)
+    total = float(por_fundo.sum())
+    participacao = por_fundo / total if total else por_fundo * 0.0
+
+    detentores = []
+    for fundo, valor in por_fundo.head(limite).items():
+        total_fundo = agregados.get(fundo, {}).get('total')
+        detentores.append({
+            "fundo": fundo,
+            "valor": float(valor),
+            "perc_do_total": float(participacao[fundo] * 100),
+            "perc_do_fundo": float(valor / total_fundo * 100) if total_fundo else None,
+        })
+
+    nomes = [c for c in COLUNAS_EXPOSICAO[tipo] if c in linhas.columns]
+    return {
+        "tipo": tipo,
+        "chave": chave,
+        "identificacao": {c: sorted(set(linhas[c].dropna().astype(str))) for c in nomes},
+        "valor_total": total,
+        "total_fundos": int(len(por_fundo)),
+        "total_posicoes": int(len(linhas)),
+        # Herfindahl-Hirschman (0 a 1) e fatia dos 5 maiores detentores
+        "concentracao": {
+            "hhi": float((participacao ** 2).sum()),
+            "top5_perc": float(participacao.head(5).sum() * 100),
+        },
+        "detentores": detentores,
+    }
+
+
+def _fundo_existe(df_completo, fundo_escolhido):
+    """Validação O(1) pelo índice de fundos (varredura só se o índice não vale para este DF)."""
+    derivados = DERIVADOS
+    indice = derivados.get('indice_fundos')
+    if derivados.get('df') is df_completo and indice is not None:
+        return fundo_escolhido in indice
+    return bool((df_completo[COLUNA_FILTRO] == fundo_escolhido).any())
+
+
+def _publicar_dados(df, versao, anteriores=None, fundos_afetados=None):
+    """Calcula as estruturas derivadas e publica o novo DF_UNICO (com a versão dos dados).
+
+    Com 'anteriores' (o DERIVADOS em uso) e 'fundos_afetados', os agregados só são
+    recalculados para esses fundos e o índice de busca é reaproveitado se o conjunto de
+    fundos não mudou. A troca é uma única atribuição: leitores nunca esperam.
+    A data dos dados (Last-Modified das páginas) vem de ASSINATURA_CARREGADA, que
+    deve ser atualizada antes da chamada.
+    """
+    global DF_UNICO, DERIVADOS
+    with medir_etapa('indexar_fundos'):
+        indice_fundos = _indexar_fundos(df)
+    with medir_etapa('calcular_agregados'):
+        if anteriores and fundos_afetados is not None and anteriores.get('agregados') is not None:
+            agregados = dict(anteriores['agregados'])
+            for fundo in fundos_afetados:
+                agregados.pop(fundo, None)
+            afetados = df[df[COLUNA_FILTRO].isin(list(fundos_afetados))]
+            agregados.update(_calcular_agregados(afetados))
+        else:
+            agregados = _calcular_agregados(df)
+    if anteriores and indice_fundos is not None and anteriores.get('indice_fundos') is not None \
+            and indice_fundos.keys() == anteriores['indice_fundos'].keys():
+        busca = anteriores.get('busca')
+    else:
+        with medir_etapa('indexar_busca'):
+            busca = _indexar_busca(df)
+    with medir_etapa('indexar_exposicao'):
+        exposicao = _indexar_exposicao(df)
+    DERIVADOS = {
+        'df': df,
+        'versao': versao,
+        'indice_fundos': indice_fundos,
+        'agregados': agregados,
+        'busca': busca,
+        'exposicao': exposicao,
+        'modificado_em': _data_dos_dados(ASSINATURA_CARREGADA),
+    }
+    DF_UNICO = df
     return DF_UNICO
 
+
+def _fatiar_fundo(df_completo, fundo_escolhido):
+    """Linhas do fundo via índice pré-calculado; None se o índice não se aplica a este DF."""
+    derivados = DERIVADOS
+    indice = derivados.get('indice_fundos')
+    if derivados.get('df') is not df_completo or indice is None:
+        return None
+    inicio, fim = indice.get(fundo_escolhido, (0, 0))
+    return df_completo.iloc[inicio:fim]
+
+
+# ----------------------------------------------------
+# FUNÇÃO DE CARREGAMENTO DE DADOS
+# ----------------------------------------------------
+def carregar_dados_consolidados():
+    global ASSINATURA_CARREGADA
+    if DF_UNICO is not None:
+        return DF_UNICO
+
+    arquivos = _listar_arquivos_csv()
+    if pa is None:
+        if MODO_CARGA == 'streaming':
+            print("⚠️ O modo de carga 'streaming' requer o pacote 'pyarrow': lendo os arquivos inteiros.")
+        df = _ler_csvs_tipados(arquivos)
+        ASSINATURA_CARREGADA = _assinar_arquivos(arquivos)
+        return _publicar_dados(df, _versao_dados(ASSINATURA_CARREGADA))
+
+    manifesto = _ler_manifesto()
+    with medir_etapa('assinar_arquivos'):
+        assinatura = _assinar_arquivos(arquivos, manifesto)
+
+    if _snapshot_valido(manifesto, assinatura):
+        try:
+            with medir_etapa('ler_snapshot'):
+                df, versao = _ler_snapshot()
+        except Exception as e:
+            df = None
+            print(f"⚠️ Snapshot inválido, relendo os CSVs: {e}")
+        if df is not None:
+            # Arquivos "tocados" sem mudança de conteúdo: atualiza o mtime no manifesto
+            if assinatura != manifesto['arquivos']:
+                _gravar_manifesto(assinatura)
+            ASSINATURA_CARREGADA = assinatura
+            contar('cda_cache_total', cache='snapshot', resultado='acerto')
+            return _publicar_dados(df, versao or _versao_dados(assinatura))
+
+    contar('cda_cache_total', cache='snapshot', resultado='falha')
+    if MODO_CARGA == 'streaming':
+        df = _carregar_em_streaming(arquivos, assinatura)
+        ASSINATURA_CARREGADA = assinatura
+        return _publicar_dados(df, _versao_dados(assinatura))
+
+    df = _ler_csvs_tipados(arquivos)
+    try:
+        with medir_etapa('gravar_snapshot'):
+            _gravar_snapshot(df, assinatura)
+    except Exception as e:
+        print(f"⚠️ Não foi possível gravar o snapshot em cache: {e}")
+    ASSINATURA_CARREGADA = assinatura
+    return _publicar_dados(df, _versao_dados(assinatura))
+
+
+def recarregar_se_snapshot_mudou():
+    """Troca os dados do processo se outro processo publicou um snapshot novo.
+
+    Roda na thread de _executar_verificador_snapshot, nunca numa requisição: a leitura
+    e os índices do DF novo podem levar segundos. A troca é atômica (_publicar_dados):
+    requisições em andamento continuam com o DF antigo, as seguintes já usam o novo.
+    """
+    global ASSINATURA_CARREGADA
+    if SNAPSHOT_CARREGADO is None:
+        return False
+    try:
+        if _identidade_arquivo(ARQUIVO_SNAPSHOT) == SNAPSHOT_CARREGADO:
+            return False
+        df, versao = _ler_snapshot()
+        ASSINATURA_CARREGADA = (_ler_manifesto() or {}).get('arquivos')
+        _publicar_dados(df, versao, anteriores=DERIVADOS)
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar o snapshot novo: {e}")
+        return False
+    print("🔄 Snapshot novo carregado.")
+    return True
+
+
+def atualizar_arquivos_alterados():
+    """Aplica ao DF_UNICO só os CSVs adicionados, alterados ou removidos desde a carga.
+
+    As linhas de cada arquivo são identificadas por Arquivo_Origem: as do arquivo
+    antigo saem, as do novo entram. Índices e agregados são refeitos (os agregados só
+    para os fundos afetados), o snapshot é regravado e os dados trocados atomicamente.
+    Retorna True se algo mudou.
+    """
+    global ASSINATURA_CARREGADA
+    if DF_UNICO is None or ASSINATURA_CARREGADA is None:
+        return False
+    anterior = ASSINATURA_CARREGADA
+    assinatura = _assinar_arquivos(_listar_arquivos_csv(), {'arquivos': anterior})
+    alterados = [
+        nome for nome, info in assinatura.items()
+        if nome not in anterior or anterior[nome]['sha1'] != info['sha1']
+    ]
+    removidos = [nome for nome in anterior if nome not in assinatura]
+    if not alterados and not removidos:
+        ASSINATURA_CARREGADA = assinatura
+        return False
+
+    if MODO_CARGA == 'streaming' and pa is not None:
+        # Em streaming o DF só tem as colunas usadas: refaz o snapshot em blocos, que
+        # mantém o pico de memória no orçamento (reler o arquivo inteiro não manteria)
+        df = _carregar_em_streaming(_listar_arquivos_csv(), assinatura)
+        ASSINATURA_CARREGADA = assinatura
+        _publicar_dados(df, _versao_dados(assinatura), anteriores=DERIVADOS)
+        print(f"🔄 Dados atualizados em streaming: {len(alterados)} arquivo(s) alterado(s), {len(removidos)} removido(s).")
+        return True
+
+    derivados = DERIVADOS
+    df_atual = derivados['df']
+    afetados = set(alterados) | set(removidos)
+    fundos_afetados = set(
+        df_atual.loc[df_atual['Arquivo_Origem'].isin(list(afetados)), COLUNA_FILTRO].astype(str)
+    )
+    # Partes na ordem dos arquivos (como na carga completa): a ordenação estável
+    # então reproduz exatamente o resultado de uma releitura de tudo. As colunas
+    # seguem os cabeçalhos dos arquivos que restaram: as que só existiam num arquivo
+    # removido saem (inclusive as obrigatórias, que _normalizar_tipos manteria vazias)
+    origem = df_atual['Arquivo_Origem'].astype(str)
+    partes = []
+    colunas = []
+    for nome_arquivo in sorted(assinatura):
+        if nome_arquivo not in alterados:
+            partes.append(df_atual[origem == nome_arquivo])
+            cabecalho = _colunas_do_csv(os.path.join(CAMINHO_PASTA, nome_arquivo)) + ['Arquivo_Origem']
+            colunas.extend(c for c in cabecalho if c not in colunas)
+            continue
+        df_novo, relatorio = _ler_arquivo_csv(os.path.join(CAMINHO_PASTA, nome_arquivo))
+        if df_novo is None:
+            # Arquivo ilegível (ex.: ainda sendo copiado): tenta de novo na próxima rodada
+            print(f"❌ Erro: Não foi possível ler o arquivo {nome_arquivo}: {relatorio['erro']}")
+            return False
+        print(f"📄 {nome_arquivo}: {relatorio['linhas']} linhas em {relatorio['segundos']:.2f}s (recarregado)")
+        df_novo = df_novo.dropna(subset=[COLUNA_FILTRO])
+        fundos_afetados |= set(df_novo[COLUNA_FILTRO].astype(str))
+        partes.append(df_novo)
+        colunas.extend(c for c in df_novo.columns if c not in colunas)
+
+    # Categorias diferentes entre as partes viram object no concat; _normalizar_tipos recompacta
+    df = pd.concat(partes, ignore_index=True)
+    df = _normalizar_tipos(_ordenar_por_fundo(df[[c for c in colunas if c in df.columns]]))
+    if set(df.columns) != set(df_atual.columns):
+        # Coluna nova ou removida muda os gráficos de todos os fundos, não só dos afetados
+        fundos_afetados = None
+    if pa is not None:
+        try:
+            _gravar_snapshot(df, assinatura)
+        except Exception as e:
+            print(f"⚠️ Não foi possível gravar o snapshot em cache: {e}")
+    ASSINATURA_CARREGADA = assinatura
+    _publicar_dados(df, _versao_dados(assinatura), anteriores=derivados, fundos_afetados=fundos_afetados)
+    print(f"🔄 Dados atualizados: {len(alterados)} arquivo(s) relido(s), {len(removidos)} removido(s).")
+    return True
+
+
+def _adquirir_trava_watcher():
+    """Trava exclusiva (não bloqueante) para que só um processo rode o watcher."""
+    if fcntl is None:
+        return True
+    try:
+        os.makedirs(CAMINHO_CACHE, exist_ok=True)
+        arquivo = open(ARQUIVO_TRAVA_WATCHER, 'a')
+        fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    # Mantém o arquivo aberto (e a trava) enquanto o processo viver
+    _adquirir_trava_watcher.arquivo = arquivo
+    return True
+
+
+def _executar_watcher():
+    com_trava = False
+    while True:
+        time.sleep(INTERVALO_WATCHER)
+        try:
+            # Quem não tem a trava tenta de novo a cada rodada (caso o dono tenha morrido)
+            com_trava = com_trava or _adquirir_trava_watcher()
+            if com_trava:
+                atualizar_arquivos_alterados()
+        except Exception as e:
+            print(f"⚠️ Watcher: erro ao atualizar os dados: {e}")
+
+
+def _executar_verificador_snapshot():
+    while True:
+        time.sleep(INTERVALO_VERIFICACAO_SNAPSHOT)
+        recarregar_se_snapshot_mudou()
+
+
+def iniciar_verificador_snapshot():
+    """Inicia (uma vez por processo, inclusive após o fork) a thread que troca o snapshot."""
+    global VERIFICADOR_SNAPSHOT
+    if VERIFICADOR_SNAPSHOT == os.getpid() or INTERVALO_VERIFICACAO_SNAPSHOT <= 0:
+        return
+    with TRAVA_VERIFICADOR_SNAPSHOT:
+        if VERIFICADOR_SNAPSHOT == os.getpid():
+            return
+        VERIFICADOR_SNAPSHOT = os.getpid()
+        threading.Thread(target=_executar_verificador_snapshot, name='verificador-snapshot', daemon=True).start()
+
+
+def iniciar_watcher():
+    """Inicia (uma vez por processo) a thread que observa a pasta de dados."""
+    global WATCHER
+    if WATCHER is not None or INTERVALO_WATCHER <= 0:
+        return
+    WATCHER = threading.Thread(target=_executar_watcher, name='watcher-dados', daemon=True)
+    WATCHER.start()
+
+
+def preparar_para_fork():
+    """Carrega os dados no processo mestre do gunicorn (preload_app), antes dos forks.
+
+    Os workers herdam o DF por copy-on-write. gc.freeze() tira os objetos já carregados
+    do coletor de lixo, que de outra forma escreveria neles e duplicaria as páginas
+    em cada worker.
+    """
+    carregar_dados_consolidados()
+    if CAMINHO_METRICAS:
+        # Métricas da carga feita no mestre (os workers começam sem elas)
+        gravar_metricas_processo()
+    gc.collect()
+    gc.freeze()
+
+
+@app.before_request
+def _verificar_snapshot():
+    # Só garante a thread de verificação neste processo (servidores sem o post_fork
+    # do gunicorn.conf.py); a troca dos dados nunca roda dentro da requisição
+    iniciar_verificador_snapshot()
+
+
+@app.cli.command('construir-cache')
+def construir_cache_comando():
+    """Gera o snapshot colunar dos CSVs (flask --app app construir-cache)."""
+    df = construir_snapshot()
+    print(f"✅ Snapshot gerado: {len(df)} linhas em {ARQUIVO_SNAPSHOT}")
+
+
+@app.cli.command('memoria')
+def memoria_comando():
+    """Mostra os bytes ocupados por coluna no DF consolidado (flask --app app memoria)."""
+    relatorio = relatorio_memoria(carregar_dados_consolidados())
+    print(relatorio.to_string())
+    print(f"\nTotal: {relatorio['bytes'].sum() / 2**20:,.1f} MB")
+
+# ----------------------------------------------------
+# HISTÓRICO MULTI-MÊS (partições carregadas sob demanda)
+# ----------------------------------------------------
+# Colunas que identificam uma posição ao comparar dois meses (usadas as que existirem)
+COLUNAS_CHAVE_POSICAO = [
+    'TP_APLIC', 'TP_ATIVO', 'CD_ATIVO', 'CD_ATIVO_BV_MERC', 'CPF_CNPJ_EMISSOR',
+    'EMISSOR', 'DT_VENC', 'CD_SWAP', 'DS_SWAP',
+]
+
+
+def listar_particoes():
+    """{(mês, bloco): caminho do CSV} de todos os meses disponíveis.
+
+    Procura em dados/historico/ (recursivo) e em dados/; em caso de repetição vale dados/.
+    """
+    particoes = {}
+    pastas = []
+    if os.path.isdir(CAMINHO_HISTORICO):
+        pastas.extend((raiz, nomes) for raiz, _, nomes in os.walk(CAMINHO_HISTORICO))
+    pastas.append((CAMINHO_PASTA, os.listdir(CAMINHO_PASTA)))
+    for pasta, nomes in pastas:
+        for nome_arquivo in nomes:
+            particao = _identificar_particao(nome_arquivo)
+            caminho_completo = os.path.join(pasta, nome_arquivo)
+            if particao and os.path.isfile(caminho_completo):
+                particoes[particao] = caminho_completo
+    return particoes
+
+
+def listar_meses():
+    return sorted({mes for mes, _ in listar_particoes()})
+
+
+def _remover_particoes_antigas(prefixo, atual):
+    """Apaga as conversões de versões anteriores do CSV (mesmo prefixo, outra chave)."""
+    for nome in os.listdir(CAMINHO_PARTICOES):
+        if nome.startswith(prefixo) and not nome.startswith(atual) and not nome.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(CAMINHO_PARTICOES, nome))
+            except OSError:
+                # No Windows um arquivo ainda mapeado por outro processo não pode ser apagado
+                pass
+
+
+@lru_cache(maxsize=PARTICOES_EM_CACHE)
+def _abrir_particao(caminho_csv, mtime, tamanho):
+    """Abre a partição como tabela Arrow mapeada em memória + índice {fundo: [início, fim]}.
+
+    Na primeira vez o CSV é convertido para Arrow em dados/.cache/particoes. mtime e
+    tamanho fazem parte da chave do cache: um CSV alterado gera uma partição nova, e
+    as conversões anteriores do mesmo CSV são apagadas.
+    """
+    chave = f'{caminho_csv}|{mtime}|{tamanho}|{VERSAO_SNAPSHOT}'
+    # Prefixo por CSV: permite achar (e remover) as conversões antigas do mesmo arquivo
+    prefixo = hashlib.sha1(caminho_csv.encode('utf-8')).hexdigest()[:12] + '_'
+    base = os.path.join(CAMINHO_PARTICOES, prefixo + hashlib.sha1(chave.encode('utf-8')).hexdigest()[:20])
+    arquivo_arrow = base + '.arrow'
+    arquivo_indice = base + '.json'
+
+    if not (os.path.isfile(arquivo_arrow) and os.path.isfile(arquivo_indice)):
+        df, relatorio = _ler_arquivo_csv(caminho_csv)
+        if df is None:
+            raise Exception(f"Não foi possível ler o arquivo {relatorio['arquivo']}: {relatorio['erro']}")
+        df = _normalizar_tipos(_ordenar_por_fundo(df))
+        os.makedirs(CAMINHO_PARTICOES, exist_ok=True)
+        _gravar_arrow(df, arquivo_arrow)
+        temporario = _caminho_temporario(arquivo_indice)
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(_indexar_fundos(df) or {}, f)
+        os.replace(temporario, arquivo_indice)
+        _remover_particoes_antigas(prefixo, os.path.basename(base))
+
+    tabela = _abrir_arrow(arquivo_arrow)
+    with open(arquivo_indice, encoding='utf-8') as f:
+        indice = json.load(f)
+    return tabela, indice
+
+
+def posicoes_do_mes(fundo, mes):
+    """Posições do fundo no mês, lendo só as linhas dele em cada bloco (BLC) do mês."""
+    if pa is None:
+        raise Exception("O pacote 'pyarrow' é necessário para consultar o histórico.")
+    partes = []
+    for (mes_particao, _), caminho_csv in sorted(listar_particoes().items()):
+        if mes_particao != mes:
+            continue
+        st = os.stat(caminho_csv)
+        tabela, indice = _abrir_particao(caminho_csv, st.st_mtime, st.st_size)
+        if fundo in indice:
+            inicio, fim = indice[fundo]
+            partes.append(tabela.slice(inicio, fim - inicio).to_pandas())
+    if not partes:
+        return pd.DataFrame()
+    return pd.concat(partes, ignore_index=True)
+
+
+def _resumir_posicoes(df, colunas_chave):
+    """Soma quantidade e valor por posição (chaves como texto, para casar meses diferentes)."""
+    colunas_valor = [c for c in ['QT_POS_FINAL', 'VL_MERC_POS_FINAL'] if c in df.columns]
+    if df.empty:
+        return pd.DataFrame(columns=colunas_chave + colunas_valor)
+    chaves = df[colunas_chave].astype(object).fillna('').astype(str)
+    return df[colunas_valor].groupby([chaves[c] for c in colunas_chave]).sum().reset_index()
+
+
+def comparar_meses(fundo, mes_anterior, mes_atual):
+    """Diferença mês a mês das posições de um fundo (novas, encerradas e alteradas)."""
+    df_anterior = posicoes_do_mes(fundo, mes_anterior)
+    df_atual = posicoes_do_mes(fundo, mes_atual)
+    if df_anterior.empty and df_atual.empty:
+        return pd.DataFrame()
+    colunas = set(df_anterior.columns) | set(df_atual.columns)
+    colunas_chave = [c for c in COLUNAS_CHAVE_POSICAO if c in colunas]
+    for df in (df_anterior, df_atual):
+        for coluna in colunas_chave:
+            if coluna not in df.columns:
+                df[coluna] = None
+
+    diff = pd.merge(
+        _resumir_posicoes(df_anterior, colunas_chave),
+        _resumir_posicoes(df_atual, colunas_chave),
+        on=colunas_chave, how='outer', suffixes=('_ANTERIOR', '_ATUAL'), indicator=True,
+    )
+    for coluna in ['QT_POS_FINAL', 'VL_MERC_POS_FINAL']:
+        if f'{coluna}_ANTERIOR' in diff.columns and f'{coluna}_ATUAL' in diff.columns:
+            diff[f'{coluna}_VARIACAO'] = diff[f'{coluna}_ATUAL'].fillna(0) - diff[f'{coluna}_ANTERIOR'].fillna(0)
+
+    situacao = diff['_merge'].map({'left_only': 'encerrada', 'right_only': 'nova', 'both': 'mantida'}).astype(object)
+    if 'VL_MERC_POS_FINAL_VARIACAO' in diff.columns:
+        situacao[(situacao == 'mantida') & (diff['VL_MERC_POS_FINAL_VARIACAO'] != 0)] = 'alterada'
+    diff['SITUACAO'] = situacao
+    diff = diff.drop(columns='_merge')
+    if 'VL_MERC_POS_FINAL_VARIACAO' in diff.columns:
+        diff = diff.sort_values('VL_MERC_POS_FINAL_VARIACAO', key=abs, ascending=False, kind='stable')
+    return diff.reset_index(drop=True)
+
+
 # ----------------------------------------------------
 # FUNÇÃO CENTRAL DE FILTRAGEM (CORRIGIDA)
 # Retorna dados BRUTOS (números)
@@ -74,39 +1747,393 @@ def carregar_dados_consolidados():
 def preparar_dados_filtrados_brutos(df_completo, fundo_escolhido):
     """Filtra o DF, calcula o percentual e retorna os dados brutos (sem formatação)."""
     
-    # 1. Filtra o DataFrame
-    df_filtrado = df_completo[df_completo[COLUNA_FILTRO] == fundo_escolhido].copy()
+    # 1. Filtra o DataFrame (fatia pelo índice de fundos; varredura completa só como fallback)
+    with medir_etapa('filtrar_fundo'):
+        df_filtrado = _fatiar_fundo(df_completo, fundo_escolhido)
+        contar('cda_cache_total', cache='indice_fundos', resultado='falha' if df_filtrado is None else 'acerto')
+        if df_filtrado is None:
+            df_filtrado = df_completo[df_completo[COLUNA_FILTRO] == fundo_escolhido]
+        df_filtrado = df_filtrado.copy()
     
     coluna_valor = 'VL_MERC_POS_FINAL'
     if coluna_valor not in df_filtrado.columns:
         # Se não houver a coluna, retorna dataframe vazio
         return pd.DataFrame()
         
-    # 2. Garante que a coluna de valor é numérica (float)
-    df_filtrado[coluna_valor] = (
-        df_filtrado[coluna_valor]
-        .astype(str)
-        .str.replace('.', '', regex=False)
-        .str.replace(',', '.', regex=False)
-        .astype(float)
-        .fillna(0)
+    with medir_etapa('calcular_percentual'):
+        # 2. A coluna de valor já é float64 (normalizada em carregar_dados_consolidados)
+        df_filtrado[coluna_valor] = df_filtrado[coluna_valor].fillna(0)
+
+        # 3. Calcula o total do fundo
+        total_fundo = df_filtrado[coluna_valor].sum()
+
+        # 4. Calcula a nova coluna de percentual (como float)
+        if total_fundo != 0:
+            df_filtrado['Perc_Pos_Final'] = (df_filtrado[coluna_valor] / total_fundo) * 100
+        else:
+            df_filtrado['Perc_Pos_Final'] = 0.0
+
+    return df_filtrado
+
+# ----------------------------------------------------
+# TABELA DE POSIÇÕES (seleção, formatação vetorizada e paginação)
+# ----------------------------------------------------
+LIMITE_PAGINA_PADRAO = 100
+LIMITE_PAGINA_MAXIMO = 1000
+TAMANHO_LOTE_STREAM = 500
+LIMITE_BUSCA_PADRAO = 20
+LIMITE_BUSCA_MAXIMO = 100
+
+
+def _formatar_numero(serie, casas, separador_milhar, separador_decimal):
+    """Formata números com separadores escolhidos, sem laço Python por linha."""
+    valores = serie.astype('float64')
+    escala = 10 ** casas
+    unidades = np.floor(valores.fillna(0).abs().to_numpy() * escala + 0.5).astype('int64')
+    inteiros = (
+        pd.Series(unidades // escala, index=serie.index).astype(str)
+        .str.replace(r'\B(?=(\d{3})+$)', separador_milhar, regex=True)
     )
-    
-    # 3. Calcula o total do fundo
-    total_fundo = df_filtrado[coluna_valor].sum()
-    
-    # 4. Calcula a nova coluna de percentual (como float)
-    if total_fundo != 0:
-        df_filtrado['Perc_Pos_Final'] = (df_filtrado[coluna_valor] / total_fundo) * 100
+    decimais = pd.Series(unidades % escala, index=serie.index).astype(str).str.zfill(casas)
+    sinal = pd.Series(np.where(valores < 0, '-', ''), index=serie.index)
+    return sinal + inteiros + separador_decimal + decimais
+
+
+def _formatar_brl(serie):
+    """Formato brasileiro (R$ 1.234,56)."""
+    return 'R$ ' + _formatar_numero(serie, 2, '.', ',')
+
+
+def _formatar_percentual(serie):
+    """Percentual com 4 casas (1,234.5678%)."""
+    return _formatar_numero(serie, 4, ',', '.') + '%'
+
+
+def _selecionar_colunas_tabela(df_raw):
+    """Colunas exibidas/exportadas, na ordem de COLUNAS_FINAL_MAP (ainda com nomes originais)."""
+    colunas_selecionadas = [col for col in COLUNAS_FINAL_MAP.keys() if col in df_raw.columns]
+    return df_raw[colunas_selecionadas]
+
+
+def _formatar_tabela(df_tabela):
+    """Converte as colunas numéricas em texto de exibição e renomeia para os nomes bonitos."""
+    colunas = {}
+    for coluna in df_tabela.columns:
+        serie = df_tabela[coluna]
+        if coluna == 'Perc_Pos_Final':
+            texto = _formatar_percentual(serie)
+        elif coluna == 'VL_MERC_POS_FINAL':
+            texto = _formatar_brl(serie)
+        else:
+            texto = serie
+        # Valores ausentes viram None (null no JSON)
+        colunas[coluna] = texto.astype(object).where(serie.notna(), None)
+    return pd.DataFrame(colunas, index=df_tabela.index).rename(columns=COLUNAS_FINAL_MAP)
+
+
+def _filtrar_ordenar_tabela(df_tabela, filtro=None, ordenar=None, decrescente=False):
+    """Aplica o filtro de texto (qualquer coluna) e a ordenação sobre os valores brutos."""
+    if filtro:
+        mascara = pd.Series(False, index=df_tabela.index)
+        for coluna in df_tabela.columns:
+            mascara |= df_tabela[coluna].astype(str).str.contains(filtro, case=False, regex=False)
+        df_tabela = df_tabela[mascara]
+    if ordenar in df_tabela.columns:
+        df_tabela = df_tabela.sort_values(ordenar, ascending=not decrescente, kind='stable')
+    return df_tabela
+
+
+# ----------------------------------------------------
+# EXPORTAÇÃO (xlsx/csv/parquet) COM CACHE EM DISCO
+# ----------------------------------------------------
+def _escrever_excel(df_exportar, caminho, nome_aba='Posicoes'):
+    """Grava o xlsx; fundos grandes são escritos linha a linha com constant_memory.
+
+    (O to_excel do pandas escreve coluna a coluna, o que o modo constant_memory não suporta.)
+    """
+    if len(df_exportar) < LINHAS_EXCEL_CONSTANT_MEMORY:
+        with pd.ExcelWriter(caminho, engine='xlsxwriter') as writer:
+            df_exportar.to_excel(writer, index=False, sheet_name=nome_aba)
+        return
+
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(nome_aba)
+    negrito = workbook.add_format({'bold': True})
+    worksheet.write_row(0, 0, list(df_exportar.columns), negrito)
+    linha_atual = 1
+    for inicio in range(0, len(df_exportar), TAMANHO_LOTE_EXPORTACAO):
+        lote = df_exportar.iloc[inicio:inicio + TAMANHO_LOTE_EXPORTACAO].astype(object)
+        for linha in lote.where(lote.notna(), None).itertuples(index=False):
+            worksheet.write_row(linha_atual, 0, linha)
+            linha_atual += 1
+    workbook.close()
+
+
+def _escrever_csv(df_exportar, caminho):
+    """CSV no padrão brasileiro (';' e vírgula decimal), escrito em lotes."""
+    with open(caminho, 'w', encoding='utf-8-sig', newline='') as f:
+        for inicio in range(0, max(len(df_exportar), 1), TAMANHO_LOTE_EXPORTACAO):
+            df_exportar.iloc[inicio:inicio + TAMANHO_LOTE_EXPORTACAO].to_csv(
+                f, sep=';', decimal=',', index=False, header=(inicio == 0))
+
+
+def _escrever_exportacao(df_exportar, caminho, formato):
+    if formato == 'xlsx':
+        _escrever_excel(df_exportar, caminho)
+    elif formato == 'csv':
+        _escrever_csv(df_exportar, caminho)
     else:
-        df_filtrado['Perc_Pos_Final'] = 0.0
+        df_exportar.to_parquet(caminho, index=False)
+
+
+def _limpar_cache_exportacoes(manter=None):
+    """Remove os arquivos usados há mais tempo até o cache caber em LIMITE_CACHE_EXPORTACOES.
+
+    'manter' (o arquivo que acabou de ser gerado e ainda vai ser enviado) nunca é
+    removido, nem os temporários que outros workers estão escrevendo.
+    """
+    arquivos = []
+    for nome_arquivo in os.listdir(CAMINHO_EXPORTACOES):
+        caminho = os.path.join(CAMINHO_EXPORTACOES, nome_arquivo)
+        if caminho == manter or '.tmp' in nome_arquivo:
+            continue
+        try:
+            st = os.stat(caminho)
+        except FileNotFoundError:
+            continue
+        arquivos.append((st.st_mtime, st.st_size, caminho))
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= LIMITE_CACHE_EXPORTACOES:
+            break
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+
+
+def obter_exportacao(df_exportar, chave, formato, escrever=None):
+    """Caminho do arquivo exportado, gerando-o só se não estiver no cache.
+
+    'chave' deve identificar o conteúdo (ex.: fundo + versão dos dados). Um acerto
+    atualiza o mtime do arquivo, que é o critério de LRU da limpeza. 'df_exportar'
+    pode ser uma função que monta o DF: só é chamada se o arquivo precisar ser
+    gerado. 'escrever' substitui o gravador padrão do formato (recebe df, caminho e formato).
+    """
+    os.makedirs(CAMINHO_EXPORTACOES, exist_ok=True)
+    nome_cache = hashlib.sha1(f'{chave}|{formato}'.encode('utf-8')).hexdigest() + '.' + formato
+    caminho = os.path.join(CAMINHO_EXPORTACOES, nome_cache)
+    try:
+        os.utime(caminho)
+        contar('cda_cache_total', cache='exportacoes', resultado='acerto')
+        return caminho
+    except FileNotFoundError:
+        contar('cda_cache_total', cache='exportacoes', resultado='falha')
+
+    if callable(df_exportar):
+        df_exportar = df_exportar()
+    # O temporário mantém a extensão (o ExcelWriter escolhe o formato por ela)
+    temporario = _caminho_temporario(caminho, sufixo='.tmp.' + formato)
+    try:
+        (escrever or _escrever_exportacao)(df_exportar, temporario, formato)
+        try:
+            os.replace(temporario, caminho)
+        except OSError:
+            # Outro worker/thread publicou o mesmo arquivo antes (no Windows o destino
+            # aberto não pode ser substituído): o dele serve
+            if not os.path.exists(caminho):
+                raise
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    _limpar_cache_exportacoes(manter=caminho)
+    return caminho
+
+
+# ----------------------------------------------------
+# EXPORTAÇÃO EM LOTE (vários fundos de uma vez)
+# ----------------------------------------------------
+LAYOUTS_LOTE = ('abas', 'longo')
+CARACTERES_INVALIDOS_ABA = re.compile(r'[\[\]:*?/\\]')
+
+
+def _somente_digitos(serie):
+    """Dígitos de uma coluna de texto (calculado só sobre as categorias, se for categórica)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        digitos = serie.cat.categories.astype(str).str.replace(r'\D', '', regex=True).to_numpy()
+        codigos = serie.cat.codes.to_numpy()
+        return pd.Series(np.where(codigos >= 0, digitos[codigos], ''), index=serie.index)
+    return serie.astype(str).str.replace(r'\D', '', regex=True)
+
+
+def preparar_lote(df_completo, identificadores):
+    """Posições de vários fundos (por nome ou CNPJ) com Perc_Pos_Final num único passe.
+
+    Retorna (DF com os fundos encontrados, lista de identificadores não encontrados).
+    """
+    identificadores = [str(i).strip() for i in identificadores if str(i).strip()]
+    nomes = set(identificadores)
+    # Identificadores com 14 dígitos (com ou sem pontuação) também são procurados como CNPJ
+    cnpjs = {d for d in (''.join(filter(str.isdigit, i)) for i in identificadores) if len(d) == 14}
+
+    mascara = df_completo[COLUNA_FILTRO].isin(nomes)
+    encontrados = set(df_completo.loc[mascara, COLUNA_FILTRO].astype(str))
+    if 'CNPJ_FUNDO_CLASSE' in df_completo.columns and cnpjs:
+        digitos_cnpj = _somente_digitos(df_completo['CNPJ_FUNDO_CLASSE'])
+        por_cnpj = digitos_cnpj.isin(cnpjs)
+        mascara |= por_cnpj
+        encontrados |= set(digitos_cnpj[por_cnpj].astype(str))
+
+    nao_encontrados = [
+        i for i in identificadores
+        if i not in encontrados and ''.join(filter(str.isdigit, i)) not in encontrados
+    ]
+    df_lote = df_completo[mascara].copy()
+    if 'VL_MERC_POS_FINAL' not in df_lote.columns:
+        return pd.DataFrame(), identificadores
+
+    # Mesmo cálculo de preparar_dados_filtrados_brutos, para todos os fundos de uma vez
+    df_lote['VL_MERC_POS_FINAL'] = df_lote['VL_MERC_POS_FINAL'].fillna(0)
+    totais = df_lote.groupby(COLUNA_FILTRO, observed=True)['VL_MERC_POS_FINAL'].transform('sum')
+    df_lote['Perc_Pos_Final'] = (df_lote['VL_MERC_POS_FINAL'] / totais * 100).where(totais != 0, 0.0)
+    return df_lote, nao_encontrados
+
+
+def _nome_aba(nome, usados):
+    """Nome de aba válido no Excel (até 31 caracteres, sem []:*?/\\) e sem repetição."""
+    base = CARACTERES_INVALIDOS_ABA.sub(' ', str(nome)).strip()[:31] or 'Fundo'
+    candidato = base
+    contador = 2
+    while candidato.upper() in usados:
+        sufixo = f'~{contador}'
+        candidato = base[:31 - len(sufixo)] + sufixo
+        contador += 1
+    usados.add(candidato.upper())
+    return candidato
+
+
+def _colunas_lote(df_lote):
+    """Colunas exportadas no lote: o nome do fundo seguido das colunas da tabela."""
+    colunas = [COLUNA_FILTRO] + list(_selecionar_colunas_tabela(df_lote).columns)
+    return df_lote[colunas].rename(columns={**COLUNAS_FINAL_MAP, COLUNA_FILTRO: 'Fundo'})
+
+
+def escrever_lote(df_lote, caminho, formato, layout='abas'):
+    """Grava o lote: uma aba por fundo (só xlsx) ou um arquivo longo com todos os fundos."""
+    df_exportar = _colunas_lote(df_lote)
+    if layout != 'abas' or formato != 'xlsx':
+        _escrever_exportacao(df_exportar, caminho, formato)
+        return
+    usados = set()
+    with pd.ExcelWriter(caminho, engine='xlsxwriter') as writer:
+        for fundo, df_fundo in df_exportar.groupby('Fundo', observed=True, sort=True):
+            df_fundo.to_excel(writer, index=False, sheet_name=_nome_aba(fundo, usados))
 
-    return df_filtrado
 
 # ----------------------------------------------------
 # ROTAS DO FLASK (Lógica da Aplicação Web)
 # ----------------------------------------------------
 
+# ----------------------------------------------------
+# CACHE HTTP DAS PÁGINAS DE FUNDO (ETag, Last-Modified e compressão)
+# ----------------------------------------------------
+def _comprimir(corpo):
+    """Variantes do corpo por Content-Encoding (geradas uma vez, na renderização)."""
+    variantes = {'identity': corpo, 'gzip': gzip.compress(corpo, NIVEL_GZIP)}
+    if brotli is not None:
+        variantes['br'] = brotli.compress(corpo)
+    return variantes
+
+
+def _obter_resposta_cacheada(chave, gerar):
+    """Variantes comprimidas da resposta 'chave'; chama gerar() (-> bytes) só na falta."""
+    global TAMANHO_CACHE_RESPOSTAS
+    with TRAVA_CACHE_RESPOSTAS:
+        variantes = CACHE_RESPOSTAS.get(chave)
+        if variantes is not None:
+            CACHE_RESPOSTAS.move_to_end(chave)
+    if variantes is not None:
+        contar('cda_cache_total', cache='respostas', resultado='acerto')
+        return variantes
+    contar('cda_cache_total', cache='respostas', resultado='falha')
+
+    with medir_etapa('comprimir'):
+        variantes = _comprimir(gerar())
+    with TRAVA_CACHE_RESPOSTAS:
+        if chave not in CACHE_RESPOSTAS:
+            CACHE_RESPOSTAS[chave] = variantes
+            TAMANHO_CACHE_RESPOSTAS += sum(len(corpo) for corpo in variantes.values())
+            # Remove as menos usadas acima do limite (a recém-criada sempre fica)
+            while TAMANHO_CACHE_RESPOSTAS > LIMITE_CACHE_RESPOSTAS and len(CACHE_RESPOSTAS) > 1:
+                _, removida = CACHE_RESPOSTAS.popitem(last=False)
+                TAMANHO_CACHE_RESPOSTAS -= sum(len(corpo) for corpo in removida.values())
+    return variantes
+
+
+def _responder_com_cache(rota, fundo, mimetype, gerar):
+    """Resposta condicional (304 se o cliente já tem esta versão) e comprimida.
+
+    A página de um fundo só depende do fundo e da versão dos dados: o ETag é a versão
+    e o Last-Modified a data dos CSVs. O navegador sempre revalida (no-cache), o que
+    custa só esta verificação enquanto os dados não mudam.
+    """
+    derivados = DERIVADOS
+    versao = derivados.get('versao')
+    resposta = Response(mimetype=mimetype)
+    resposta.set_etag(versao, weak=True)
+    resposta.last_modified = derivados.get('modificado_em')
+    resposta.cache_control.no_cache = True
+    resposta.vary.add('Accept-Encoding')
+    resposta.make_conditional(request)
+    if resposta.status_code == 304:
+        return resposta
+
+    variantes = _obter_resposta_cacheada((rota, fundo, versao), gerar)
+    codificacao = next(
+        (c for c in ('br', 'gzip') if c in variantes and request.accept_encodings[c]), 'identity'
+    )
+    resposta.set_data(variantes[codificacao])
+    if codificacao != 'identity':
+        resposta.headers['Content-Encoding'] = codificacao
+    return resposta
+
+
+def _graficos_fundo(df, fundo_escolhido, df_raw=None):
+    """Agregados dos gráficos do fundo (pré-calculados; recalcula só se não valem para o DF)."""
+    with medir_etapa('agregados_graficos'):
+        agregado = _agregado_fundo(df, fundo_escolhido)
+        contar('cda_cache_total', cache='agregados', resultado='falha' if agregado is None else 'acerto')
+        if agregado is None:
+            if df_raw is None:
+                df_raw = preparar_dados_filtrados_brutos(df, fundo_escolhido)
+            agregado = _calcular_agregados(df_raw)[fundo_escolhido]
+    return agregado
+
+
+def _renderizar_resultado(df, fundo_escolhido):
+    """HTML da página de resultado do fundo (gráficos + tabela via /api/posicoes)."""
+    # 1. Pega os dados brutos (com números float)
+    df_raw = preparar_dados_filtrados_brutos(df, fundo_escolhido)
+
+    # 2. Gráficos (Top 10 ativos + Outros / por Tipo de Aplicação) vêm pré-calculados
+    agregado = _graficos_fundo(df, fundo_escolhido, df_raw)
+
+    # 3. A tabela é carregada pela página, em páginas, via /api/posicoes
+    colunas_tabela = _selecionar_colunas_tabela(df_raw).columns
+
+    with medir_etapa('renderizar'):
+        return render_template('resultado.html', 
+                               fundo=fundo_escolhido, 
+                               total_posicoes=len(df_raw),
+                               colunas=[(c, COLUNAS_FINAL_MAP[c]) for c in colunas_tabela],
+                               # Envia os dados dos gráficos para o HTML
+                               chart_data_ativos=json.dumps(agregado['ativos'], allow_nan=False),
+                               chart_data_tipo=json.dumps(agregado['tipo'], allow_nan=False)
+                              )
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     try:
@@ -117,119 +2144,97 @@ def index():
     if COLUNA_FILTRO not in df.columns:
         return render_template('erro.html', mensagem=f"A coluna de filtro ('{COLUNA_FILTRO}') não foi encontrada.")
 
-    fundos_unicos = sorted(df[COLUNA_FILTRO].dropna().unique())
-    
     if request.method == 'POST':
         fundo_escolhido = request.form.get('fundo_selecionado')
         
-        if fundo_escolhido and fundo_escolhido in fundos_unicos:
-            
-            # 1. Pega os dados brutos (com números float)
-            df_raw = preparar_dados_filtrados_brutos(df, fundo_escolhido)
-            
-            if df_raw.empty:
-                return render_template('erro.html', mensagem=f"Não foram encontrados dados para o fundo {fundo_escolhido}.")
-
-            # --- PREPARAÇÃO DOS DADOS PARA OS GRÁFICOS ---
-
-            # 2. Gráfico 1: Por Ativo (Top 10 + Outros)
-            # Garante que 'CD_ATIVO_BV_MERC' existe antes de usar
-            if 'CD_ATIVO_BV_MERC' in df_raw.columns:
-                df_top_assets = df_raw.nlargest(10, 'Perc_Pos_Final')
-                outros_perc = df_raw[~df_raw.index.isin(df_top_assets.index)]['Perc_Pos_Final'].sum()
-                
-                chart1_labels = df_top_assets['CD_ATIVO_BV_MERC'].tolist() + ['Outros']
-                chart1_data = df_top_assets['Perc_Pos_Final'].tolist() + [outros_perc]
-                
-                chart_data_ativos = {
-                    "labels": chart1_labels,
-                    "data": chart1_data
-                }
-            else:
-                chart_data_ativos = {"labels": [], "data": []}
-
-            # 3. Gráfico 2: Por Tipo de Aplicação
-            if 'TP_APLIC' in df_raw.columns:
-                df_grouped_type = df_raw.groupby('TP_APLIC')['Perc_Pos_Final'].sum().reset_index()
-                
-                chart_data_tipo = {
-                    "labels": df_grouped_type['TP_APLIC'].tolist(),
-                    "data": df_grouped_type['Perc_Pos_Final'].tolist()
-                }
-            else:
-                chart_data_tipo = {"labels": [], "data": []}
-
-            # --- PREPARAÇÃO DOS DADOS PARA A TABELA (Formatação) ---
-            
-            # 4. Seleciona apenas as colunas que queremos mostrar
-            colunas_selecionadas = [col for col in COLUNAS_FINAL_MAP.keys() if col in df_raw.columns]
-            df_tabela = df_raw[colunas_selecionadas].copy()
-
-            # 5. Formata os números como texto para exibição
-            if 'Perc_Pos_Final' in df_tabela.columns:
-                df_tabela['Perc_Pos_Final'] = df_tabela['Perc_Pos_Final'].map('{:,.4f}%'.format)
-            if 'VL_MERC_POS_FINAL' in df_tabela.columns:
-                # Formato brasileiro (R$ 1.234,56)
-                df_tabela['VL_MERC_POS_FINAL'] = df_tabela['VL_MERC_POS_FINAL'].apply(
-                    lambda x: f"R$ {x:,.2f}".replace(',', '_TEMP_').replace('.', ',').replace('_TEMP_', '.')
-                )
-
-            # 6. Renomeia as colunas para os nomes bonitos
-            df_tabela = df_tabela.rename(columns=COLUNAS_FINAL_MAP)
-
-            # 7. Converte para HTML
-            tabela_html = df_tabela.to_html(classes='table table-striped table-hover', index=False)
-            
-            return render_template('resultado.html', 
-                                   fundo=fundo_escolhido, 
-                                   total_posicoes=len(df_tabela),
-                                   tabela_html=tabela_html,
-                                   # Envia os dados dos gráficos para o HTML
-                                   chart_data_ativos=json.dumps(chart_data_ativos),
-                                   chart_data_tipo=json.dumps(chart_data_tipo)
-                                  )
+        if fundo_escolhido and _fundo_existe(df, fundo_escolhido):
+            # A página do fundo tem URL própria (GET): pode ser cacheada e revalidada
+            return redirect(url_for('pagina_fundo', fundo=fundo_escolhido), code=303)
 
         else:
             return render_template('erro.html', mensagem="Fundo selecionado inválido ou não encontrado.")
 
-    # Método GET
-    return render_template('index.html', fundos=fundos_unicos)
+    # Método GET (as sugestões de fundos vêm de /api/fundos conforme o usuário digita)
+    indice = DERIVADOS.get('indice_fundos') if DERIVADOS.get('df') is df else None
+    total_fundos = len(indice) if indice is not None else df[COLUNA_FILTRO].nunique()
+    return render_template('index.html', total_fundos=total_fundos)
+
+
+@app.route('/fundo/<path:fundo>', methods=['GET'])
+def pagina_fundo(fundo):
+    """Página de resultado do fundo, servida do cache e revalidada por ETag."""
+    try:
+        df = carregar_dados_consolidados()
+    except Exception as e:
+        return render_template('erro.html', mensagem=f"Erro ao carregar dados: {e}"), 500
+
+    if not _fundo_existe(df, fundo) or 'VL_MERC_POS_FINAL' not in df.columns:
+        return render_template('erro.html', mensagem=f"Não foram encontrados dados para o fundo {fundo}."), 404
+
+    return _responder_com_cache('pagina_fundo', fundo, 'text/html',
+                                lambda: _renderizar_resultado(df, fundo).encode('utf-8'))
+
+
+@app.route('/api/graficos/<path:fundo>', methods=['GET'])
+def api_graficos(fundo):
+    """Dados dos gráficos do fundo (top ativos e tipos de aplicação) em JSON."""
+    try:
+        df = carregar_dados_consolidados()
+    except Exception as e:
+        return jsonify(erro=f"Erro ao carregar dados: {e}"), 500
+
+    if not _fundo_existe(df, fundo) or 'VL_MERC_POS_FINAL' not in df.columns:
+        return jsonify(erro=f"Não foram encontrados dados para o fundo {fundo}."), 404
 
+    def gerar():
+        agregado = _graficos_fundo(df, fundo)
+        return json.dumps({
+            "fundo": fundo,
+            "total": agregado['total'],
+            "posicoes": agregado['posicoes'],
+            "ativos": agregado['ativos'],
+            "tipo": agregado['tipo'],
+        }, allow_nan=False).encode('utf-8')
 
-@app.route('/download/<fundo>', methods=['POST'])
+    return _responder_com_cache('api_graficos', fundo, 'application/json', gerar)
 
 
+@app.route('/download/<fundo>', methods=['GET', 'POST'])
 def download(fundo):
-    """Exporta o DataFrame Filtrado para Excel (com números)."""
+    """Exporta o DataFrame Filtrado (com números) em xlsx, csv ou parquet (?formato=)."""
+    formato = (request.values.get('formato') or 'xlsx').lower()
+    if formato not in FORMATOS_EXPORTACAO:
+        return f"Formato de exportação inválido: {formato}.", 400
+    if formato == 'parquet' and pa is None:
+        return "Exportação em parquet requer o pacote 'pyarrow'.", 400
+
     try:
         df = carregar_dados_consolidados()
-        
-        # 1. Pega os dados brutos (com números float)
-        df_raw = preparar_dados_filtrados_brutos(df, fundo)
-        
-        if df_raw.empty:
+        if not _fundo_existe(df, fundo):
             return "Nenhum dado para este fundo.", 404
-        
-        # 2. Seleciona as colunas
-        colunas_selecionadas = [col for col in COLUNAS_FINAL_MAP.keys() if col in df_raw.columns]
-        df_exportar = df_raw[colunas_selecionadas].copy()
-        
-        # 3. Renomeia as colunas
-        df_exportar = df_exportar.rename(columns=COLUNAS_FINAL_MAP)
-            
-        # Cria um buffer de memória para o arquivo Excel
-        output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='xlsxwriter') 
-        df_exportar.to_excel(writer, index=False, sheet_name='Posicoes')
-        writer.close()
-        output.seek(0)
+
+        def montar():
+            # 1. Pega os dados brutos (com números float)
+            df_raw = preparar_dados_filtrados_brutos(df, fundo)
+            with medir_etapa('selecionar_colunas'):
+                # 2. Seleciona as colunas e 3. Renomeia as colunas
+                return _selecionar_colunas_tabela(df_raw).rename(columns=COLUNAS_FINAL_MAP)
+
+        # 4. Gera o arquivo (ou reaproveita do cache, se os dados não mudaram): o DF
+        # só é montado se o arquivo ainda não estiver no cache
+        derivados = DERIVADOS
+        versao = derivados.get('versao') if derivados.get('df') is df else None
+        chave = f'{fundo}|{versao or datetime.now().isoformat()}'
+        with medir_etapa(f'exportar_{formato}'):
+            caminho = obter_exportacao(montar, chave, formato)
 
         # Cria o nome do arquivo seguro para download
         fundo_simples = "".join(c for c in fundo if c.isalnum() or c.isspace())[:30].replace(' ', '_')
-        nome_arquivo_saida = f'POSICOES_{fundo_simples}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        nome_arquivo_saida = f'POSICOES_{fundo_simples}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
         
-        return send_file(output, 
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        # send_file envia o arquivo do disco em blocos, sem carregá-lo inteiro na memória
+        return send_file(caminho, 
+                         mimetype=FORMATOS_EXPORTACAO[formato],
                          as_attachment=True,
                          download_name=nome_arquivo_saida)
                          
@@ -237,10 +2242,244 @@ def download(fundo):
         return f"Erro na exportação do download: {e}", 500
 
 
+@app.route('/api/exposicao/<tipo>', methods=['GET'])
+def api_exposicao(tipo):
+    """Exposição de todos os fundos a um emissor ou ativo.
+
+    /api/exposicao/emissor?chave=<nome ou CNPJ> | /api/exposicao/ativo?chave=<código>
+    """
+    if tipo not in COLUNAS_EXPOSICAO:
+        return jsonify(erro=f"Tipo inválido: {tipo}. Use {', '.join(COLUNAS_EXPOSICAO)}."), 400
+    chave = request.args.get('chave', '').strip()
+    if not chave:
+        return jsonify(erro="Informe a 'chave' (nome, CNPJ ou código)."), 400
+    limite = min(LIMITE_BUSCA_MAXIMO, max(1, request.args.get('limite', LIMITE_BUSCA_PADRAO, type=int)))
+    try:
+        resultado = consultar_exposicao(carregar_dados_consolidados(), tipo, chave, limite)
+    except Exception as e:
+        return jsonify(erro=f"Erro ao consultar a exposição: {e}"), 500
+    if resultado is None:
+        return jsonify(erro=f"Nenhuma posição encontrada para {chave}."), 404
+    return jsonify(resultado)
+
+
+@app.route('/api/lote', methods=['POST'])
+def api_lote():
+    """Exporta vários fundos de uma vez.
+
+    Corpo JSON: {"fundos": [nomes ou CNPJs], "formato": "xlsx|csv|parquet", "layout": "abas|longo"}.
+    No layout 'abas' (só xlsx) cada fundo vira uma aba; no 'longo' todos ficam numa tabela só.
+    """
+    corpo = request.get_json(silent=True) or {}
+    if not isinstance(corpo, dict):
+        return jsonify(erro="Informe a lista de fundos em 'fundos' (nomes ou CNPJs)."), 400
+    fundos = corpo.get('fundos') or request.form.getlist('fundos')
+    formato = str(corpo.get('formato') or request.form.get('formato') or 'xlsx').lower()
+    layout = str(corpo.get('layout') or request.form.get('layout') or 'abas').lower()
+    if not fundos or not isinstance(fundos, list) or not all(isinstance(f, str) for f in fundos):
+        return jsonify(erro="Informe a lista de fundos em 'fundos' (nomes ou CNPJs)."), 400
+    if formato not in FORMATOS_EXPORTACAO or layout not in LAYOUTS_LOTE:
+        return jsonify(erro="Formato ou layout inválido."), 400
+    if formato == 'parquet' and pa is None:
+        return jsonify(erro="Exportação em parquet requer o pacote 'pyarrow'."), 400
+
+    try:
+        df = carregar_dados_consolidados()
+        df_lote, nao_encontrados = preparar_lote(df, fundos)
+        if df_lote.empty:
+            return jsonify(erro="Nenhum dos fundos informados foi encontrado.", nao_encontrados=nao_encontrados), 404
+
+        derivados = DERIVADOS
+        versao = derivados.get('versao') if derivados.get('df') is df else None
+        lista = json.dumps(sorted(str(f) for f in fundos), ensure_ascii=False)
+        chave = f'lote|{layout}|{lista}|{versao or datetime.now().isoformat()}'
+        caminho = obter_exportacao(
+            df_lote, chave, formato,
+            escrever=lambda df_lote, caminho, formato: escrever_lote(df_lote, caminho, formato, layout),
+        )
+
+        nome_arquivo_saida = f'POSICOES_LOTE_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
+        resposta = send_file(caminho,
+                             mimetype=FORMATOS_EXPORTACAO[formato],
+                             as_attachment=True,
+                             download_name=nome_arquivo_saida)
+        resposta.headers['X-Fundos-Nao-Encontrados'] = str(len(nao_encontrados))
+        return resposta
+
+    except Exception as e:
+        return jsonify(erro=f"Erro na exportação do lote: {e}"), 500
+
+
+@app.route('/api/fundos', methods=['GET'])
+def api_fundos():
+    """Autocomplete de fundos: /api/fundos?q=itau&limite=20."""
+    try:
+        df = carregar_dados_consolidados()
+    except Exception as e:
+        return jsonify(erro=f"Erro ao carregar dados: {e}"), 500
+    limite = min(LIMITE_BUSCA_MAXIMO, max(1, request.args.get('limite', LIMITE_BUSCA_PADRAO, type=int)))
+    derivados = DERIVADOS
+    indice = derivados.get('busca') if derivados.get('df') is df else None
+    if indice is None:
+        indice = _indexar_busca(df)
+    return jsonify(resultados=buscar_fundos(indice, request.args.get('q', ''), limite))
+
+
+@app.route('/api/historico/diff', methods=['GET'])
+def api_historico_diff():
+    """Diferença das posições de um fundo entre dois meses: ?fundo=...&de=AAAAMM&para=AAAAMM.
+
+    Sem 'para', usa o mês mais recente; sem 'de', o mês disponível anterior a 'para'.
+    """
+    fundo = request.args.get('fundo', '')
+    try:
+        meses = listar_meses()
+        mes_atual = request.args.get('para') or (meses[-1] if meses else None)
+        anteriores = [mes for mes in meses if mes_atual and mes < mes_atual]
+        mes_anterior = request.args.get('de') or (anteriores[-1] if anteriores else None)
+        if not mes_atual or not mes_anterior:
+            return jsonify(erro="São necessários pelo menos dois meses de dados.", meses=meses), 400
+        if mes_atual not in meses or mes_anterior not in meses:
+            return jsonify(erro="Mês não encontrado no histórico.", meses=meses), 404
+        diff = comparar_meses(fundo, mes_anterior, mes_atual)
+    except Exception as e:
+        return jsonify(erro=f"Erro ao consultar o histórico: {e}"), 500
+
+    if diff.empty:
+        return jsonify(erro=f"Não foram encontrados dados para o fundo {fundo}."), 404
+    totais = {
+        coluna: float(diff[coluna].sum())
+        for coluna in ['VL_MERC_POS_FINAL_ANTERIOR', 'VL_MERC_POS_FINAL_ATUAL'] if coluna in diff.columns
+    }
+    return jsonify(
+        fundo=fundo,
+        de=mes_anterior,
+        para=mes_atual,
+        totais=totais,
+        situacoes=diff['SITUACAO'].value_counts().to_dict(),
+        posicoes=diff.astype(object).where(diff.notna(), None).to_dict('records'),
+    )
+
+
+@app.route('/api/posicoes', methods=['GET'])
+def api_posicoes():
+    """Posições de um fundo paginadas (offset/limit), com filtro e ordenação.
+
+    Com stream=1 a resposta é NDJSON: uma linha de cabeçalho e depois uma linha por
+    posição, formatadas em lotes (as primeiras chegam antes de a tabela toda ser formatada).
+    """
+    fundo = request.args.get('fundo', '')
+    try:
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = min(LIMITE_PAGINA_MAXIMO, max(1, request.args.get('limit', LIMITE_PAGINA_PADRAO, type=int)))
+        df = carregar_dados_consolidados()
+        df_raw = preparar_dados_filtrados_brutos(df, fundo)
+    except Exception as e:
+        return jsonify(erro=f"Erro ao carregar dados: {e}"), 500
+
+    if df_raw.empty:
+        return jsonify(erro=f"Não foram encontrados dados para o fundo {fundo}."), 404
+
+    with medir_etapa('filtrar_ordenar_tabela'):
+        df_tabela = _filtrar_ordenar_tabela(
+            _selecionar_colunas_tabela(df_raw),
+            filtro=request.args.get('filtro', '').strip(),
+            ordenar=request.args.get('ordenar'),
+            decrescente=request.args.get('ordem') == 'desc',
+        )
+    colunas = [COLUNAS_FINAL_MAP[c] for c in df_tabela.columns]
+
+    if request.args.get('stream') == '1':
+        # Sem limit explícito, o stream envia todas as linhas a partir do offset
+        if 'limit' not in request.args:
+            limit = len(df_tabela)
+        pagina = df_tabela.iloc[offset:offset + limit]
+
+        def gerar():
+            yield json.dumps({"fundo": fundo, "total": len(df_tabela), "offset": offset, "colunas": colunas}) + '\n'
+            for inicio in range(0, len(pagina), TAMANHO_LOTE_STREAM):
+                lote = _formatar_tabela(pagina.iloc[inicio:inicio + TAMANHO_LOTE_STREAM])
+                yield ''.join(json.dumps(linha) + '\n' for linha in lote.values.tolist())
+
+        return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+    with medir_etapa('formatar_tabela'):
+        pagina = _formatar_tabela(df_tabela.iloc[offset:offset + limit])
+    return jsonify(
+        fundo=fundo,
+        total=len(df_tabela),
+        offset=offset,
+        limit=limit,
+        colunas=colunas,
+        linhas=pagina.values.tolist(),
+    )
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato texto do Prometheus.
+
+    Latência por rota e por etapa (histogramas), requisições por status, acertos e
+    falhas de cada cache e tamanho dos dados carregados. Com CAMINHO_METRICAS os
+    histogramas e contadores são a soma de todos os workers (os de cada um têm até
+    INTERVALO_METRICAS segundos de atraso); sem ela, são só os deste processo.
+    """
+    linhas = []
+    if CAMINHO_METRICAS:
+        histogramas, contadores = _metricas_de_todos_processos()
+    else:
+        histogramas, contadores = _metricas_do_processo()
+
+    descricoes = {
+        'cda_requisicao_segundos': 'Latência das requisições por rota.',
+        'cda_etapa_segundos': 'Duração de cada etapa cronometrada (carga, filtro, agregados, exportação...).',
+        'cda_requisicoes_total': 'Requisições atendidas por rota, método e status.',
+        'cda_cache_total': 'Acertos e falhas de cada cache.',
+    }
+    for nome in sorted({nome for nome, _ in histogramas}):
+        linhas.append(f'# HELP {nome} {descricoes.get(nome, nome)}')
+        linhas.append(f'# TYPE {nome} histogram')
+        for (nome_serie, rotulos), serie in sorted(histogramas.items()):
+            if nome_serie != nome:
+                continue
+            acumulado = 0
+            for limite, quantidade in zip(LIMITES_HISTOGRAMA, serie['baldes']):
+                acumulado += quantidade
+                linhas.append(f"{nome}_bucket{_rotulos_prometheus(rotulos + (('le', limite),))} {acumulado}")
+            linhas.append(f"{nome}_bucket{_rotulos_prometheus(rotulos + (('le', '+Inf'),))} {serie['contagem']}")
+            linhas.append(f"{nome}_sum{_rotulos_prometheus(rotulos)} {serie['soma']:.6f}")
+            linhas.append(f"{nome}_count{_rotulos_prometheus(rotulos)} {serie['contagem']}")
+    for nome in sorted({nome for nome, _ in contadores}):
+        linhas.append(f'# HELP {nome} {descricoes.get(nome, nome)}')
+        linhas.append(f'# TYPE {nome} counter')
+        for (nome_serie, rotulos), valor in sorted(contadores.items()):
+            if nome_serie == nome:
+                linhas.append(f'{nome}{_rotulos_prometheus(rotulos)} {valor}')
+
+    derivados = DERIVADOS
+    df = derivados.get('df')
+    if df is not None:
+        if 'memoria_bytes' not in derivados:
+            # Calculado uma vez por versão dos dados (memory_usage deep percorre o texto)
+            derivados['memoria_bytes'] = int(relatorio_memoria(df)['bytes'].sum())
+        indice = derivados.get('indice_fundos')
+        medidas = [
+            ('cda_dados_linhas', 'Posições carregadas.', len(df)),
+            ('cda_dados_fundos', 'Fundos carregados.', len(indice) if indice is not None else df[COLUNA_FILTRO].nunique()),
+            ('cda_dados_memoria_bytes', 'Memória ocupada pelo DataFrame carregado.', derivados['memoria_bytes']),
+        ]
+        for nome, descricao, valor in medidas:
+            linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} gauge', f'{nome} {valor}']
+
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 if __name__ == '__main__':
     try:
         print("Preparando dados...")
         carregar_dados_consolidados()
+        iniciar_watcher()
+        iniciar_verificador_snapshot()
         print("\n=======================================================")
         print("✅ Aplicação Web de Filtro Iniciada")
         print(f"Acesse o aplicativo em: http://127.0.0.1:5000/")
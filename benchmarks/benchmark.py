@@ -0,0 +1,430 @@
+"""Benchmark do app com dados CDA sintéticos (ou de uma pasta existente).
+
+Mede a carga (CSV e snapshot), preparar_dados_filtrados_brutos, o POST de / (e a
+página do fundo: renderizada, do cache e 304) e o /download (gerando o arquivo e
+servido do cache) pelo test client do Flask, e informa latência p50/p99, vazão e
+pico de memória (RSS) de cada etapa.
+
+Com --json o resultado é gravado; com --comparar, as latências p50 são conferidas
+contra um resultado anterior e o script sai com código 1 se alguma piorar além
+da tolerância. Com --verificar, em vez de medir, confere que a recarga incremental
+dá o mesmo resultado que a carga completa (sai com código 1 se não der). Com
+--verificar-memoria, confere que o pico de RSS da carga em streaming (até o snapshot
+gravado) não cresce com o nº de linhas: mede a carga de --linhas e de 4x --linhas posições (mesmos fundos),
+cada uma num processo novo, e sai com código 1 se o pico subir além da tolerância.
+
+Exemplos:
+    python benchmarks/benchmark.py --linhas 2000000 --json base.json
+    python benchmarks/benchmark.py --linhas 2000000 --comparar base.json
+    python benchmarks/benchmark.py --linhas 50000 --verificar
+    CDA_ORCAMENTO_CARGA_MB=16 python benchmarks/benchmark.py --linhas 300000 --verificar-memoria
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # resource só existe em Unix: sem ele (e sem /proc) o pico de memória não é informado
+    resource = None
+
+# Intervalo da amostragem de RSS durante cada etapa, em segundos
+INTERVALO_AMOSTRA_RSS = 0.005
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from gerar_cda import gerar_dados
+
+
+def _rss_processo(pid):
+    """RSS atual do processo, em bytes, lido de /proc (None se não disponível)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linha in f:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def _rss_atual():
+    """RSS deste processo somado ao dos filhos vivos (processos de leitura dos CSVs)."""
+    pid = os.getpid()
+    total = _rss_processo(pid)
+    if total is None:
+        return None
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            filhos = f.read().split()
+    except OSError:
+        filhos = []
+    return total + sum(_rss_processo(filho) or 0 for filho in filhos)
+
+
+def _pico_rss_vida_mb():
+    """Sem /proc: pico de RSS desde o início do processo (não isola a etapa), em MB."""
+    if resource is None:
+        return None
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    unidade = 1 if sys.platform == 'darwin' else 1024
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unidade
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unidade
+    return round(max(proprio, filhos) / 2**20, 1)
+
+
+@contextmanager
+def _medir_pico_rss():
+    """Amostra o RSS numa thread enquanto o bloco roda.
+
+    Em medida ficam o pico da etapa ('pico_mb') e quanto ele passou do RSS do início
+    ('acrescimo_mb'), ambos em MB.
+    """
+    medida = {'pico_mb': None, 'acrescimo_mb': None}
+    if _rss_atual() is None:
+        yield medida
+        medida['pico_mb'] = _pico_rss_vida_mb()
+        return
+    inicial = _rss_atual()
+    pico = [inicial]
+    parar = threading.Event()
+
+    def amostrar():
+        while not parar.wait(INTERVALO_AMOSTRA_RSS):
+            pico[0] = max(pico[0], _rss_atual() or 0)
+
+    amostrador = threading.Thread(target=amostrar, daemon=True)
+    amostrador.start()
+    try:
+        yield medida
+    finally:
+        parar.set()
+        amostrador.join()
+        pico[0] = max(pico[0], _rss_atual() or 0)
+        medida['pico_mb'] = round(pico[0] / 2**20, 1)
+        medida['acrescimo_mb'] = round((pico[0] - inicial) / 2**20, 1)
+
+
+def _apontar_app_para(pasta):
+    """Faz o app ler os CSVs de 'pasta' e gravar cache/exportações dentro dela."""
+    app.CAMINHO_PASTA = pasta
+    app.CAMINHO_CACHE = os.path.join(pasta, '.cache')
+    app.ARQUIVO_SNAPSHOT = os.path.join(app.CAMINHO_CACHE, 'dados_consolidados.arrow')
+    app.ARQUIVO_MANIFESTO = os.path.join(app.CAMINHO_CACHE, 'manifesto.json')
+    app.CAMINHO_HISTORICO = os.path.join(pasta, 'historico')
+    app.CAMINHO_PARTICOES = os.path.join(app.CAMINHO_CACHE, 'particoes')
+    app.CAMINHO_EXPORTACOES = os.path.join(app.CAMINHO_CACHE, 'exportacoes')
+    app.ARQUIVO_TRAVA_WATCHER = os.path.join(app.CAMINHO_CACHE, 'watcher.lock')
+    app.CAMINHO_PERFIS = os.path.join(app.CAMINHO_CACHE, 'perfis')
+
+
+def _descarregar():
+    app.DF_UNICO = None
+    app.DERIVADOS = {}
+
+
+def _medir(nome, funcao, argumentos, antes=None, linhas=None):
+    """Executa funcao(arg) para cada argumento e resume os tempos da etapa.
+
+    'antes' (não cronometrado) roda antes de cada chamada; 'linhas(arg, retorno)'
+    informa quantas posições a chamada processou, para a vazão em linhas/s.
+    """
+    tempos = []
+    total_linhas = 0
+    with _medir_pico_rss() as memoria:
+        for argumento in argumentos:
+            if antes:
+                antes(argumento)
+            inicio = time.perf_counter()
+            retorno = funcao(argumento)
+            tempos.append(time.perf_counter() - inicio)
+            if linhas:
+                total_linhas += linhas(argumento, retorno)
+
+    tempos = np.array(tempos)
+    resultado = {
+        'etapa': nome,
+        'execucoes': len(tempos),
+        'p50_ms': round(float(np.percentile(tempos, 50)) * 1000, 2),
+        'p99_ms': round(float(np.percentile(tempos, 99)) * 1000, 2),
+        'media_ms': round(float(tempos.mean()) * 1000, 2),
+        'vazao_por_s': round(len(tempos) / tempos.sum(), 2),
+        'linhas_por_s': round(total_linhas / tempos.sum()) if linhas else None,
+        'pico_rss_mb': memoria['pico_mb'],
+        'acrescimo_rss_mb': memoria['acrescimo_mb'],
+    }
+    acrescimo = '' if memoria['acrescimo_mb'] is None else f" (+{memoria['acrescimo_mb']} MB na etapa)"
+    print(f"⏱️  {nome}: p50 {resultado['p50_ms']} ms | p99 {resultado['p99_ms']} ms "
+          f"| {resultado['vazao_por_s']}/s | pico RSS {resultado['pico_rss_mb']} MB{acrescimo}")
+    return resultado
+
+
+def _conferir_resposta(resposta):
+    dados = resposta.get_data()
+    resposta.close()
+    if resposta.status_code != 200:
+        raise RuntimeError(f"Resposta {resposta.status_code}: {dados[:200]!r}")
+    return dados
+
+
+def _sortear_fundos(df, quantidade, rng):
+    """Fundos usados nas etapas por fundo: sorteados, sempre incluindo o maior."""
+    tamanhos = df[app.COLUNA_FILTRO].value_counts()
+    sorteados = rng.choice(tamanhos.index.to_numpy(), size=max(quantidade - 1, 0))
+    return [str(tamanhos.index[0])] + [str(f) for f in sorteados]
+
+
+def executar(pasta, repeticoes, repeticoes_carga, semente=42):
+    rng = np.random.default_rng(semente)
+    _apontar_app_para(pasta)
+    cliente = app.app.test_client()
+    resultados = []
+
+    def carregar(_):
+        _descarregar()
+        return app.carregar_dados_consolidados()
+
+    def limpar_cache(_):
+        shutil.rmtree(app.CAMINHO_CACHE, ignore_errors=True)
+
+    resultados.append(_medir('carga (CSV)', carregar, range(repeticoes_carga),
+                             antes=limpar_cache, linhas=lambda _, df: len(df)))
+    if app.pa is not None:
+        resultados.append(_medir('carga (snapshot)', carregar, range(repeticoes_carga),
+                                 linhas=lambda _, df: len(df)))
+
+    df = app.carregar_dados_consolidados()
+    fundos = _sortear_fundos(df, repeticoes, rng)
+
+    resultados.append(_medir(
+        'preparar_dados_filtrados_brutos',
+        lambda fundo: app.preparar_dados_filtrados_brutos(df, fundo), fundos,
+        linhas=lambda _, df_raw: len(df_raw),
+    ))
+    resultados.append(_medir(
+        'POST / (redirect + página)',
+        lambda fundo: _conferir_resposta(
+            cliente.post('/', data={'fundo_selecionado': fundo}, follow_redirects=True)
+        ),
+        fundos,
+    ))
+
+    with app.app.test_request_context():
+        urls = {fundo: app.url_for('pagina_fundo', fundo=fundo) for fundo in fundos}
+    resultados.append(_medir(
+        'GET /fundo (cache, gzip)',
+        lambda fundo: _conferir_resposta(cliente.get(urls[fundo], headers={'Accept-Encoding': 'gzip'})),
+        fundos,
+    ))
+    etags = {fundo: cliente.get(urls[fundo]).headers['ETag'] for fundo in fundos}
+    resultados.append(_medir(
+        'GET /fundo (304)',
+        lambda fundo: cliente.get(urls[fundo], headers={'If-None-Match': etags[fundo]}).close(),
+        fundos,
+    ))
+
+    def limpar_exportacoes(_):
+        shutil.rmtree(app.CAMINHO_EXPORTACOES, ignore_errors=True)
+
+    def baixar(fundo):
+        return _conferir_resposta(cliente.get('/download/' + fundo, query_string={'formato': 'xlsx'}))
+
+    resultados.append(_medir('download xlsx (gerando)', baixar, fundos, antes=limpar_exportacoes))
+    # A etapa anterior apaga o cache a cada chamada: gera todos antes de medir o cache
+    for fundo in fundos:
+        baixar(fundo)
+    resultados.append(_medir('download xlsx (cache)', baixar, fundos))
+    return {
+        'linhas': len(df),
+        'fundos': int(df[app.COLUNA_FILTRO].nunique()),
+        'memoria_dados_mb': round(df.memory_usage(deep=True).sum() / 2**20, 1),
+        'etapas': resultados,
+    }
+
+
+def _estado_carregado():
+    """DF e gráficos publicados, em forma comparável (NaN vira texto no JSON)."""
+    agregados = json.dumps(app.DERIVADOS['agregados'], sort_keys=True, default=str)
+    return app.DERIVADOS['df'], agregados
+
+
+def verificar_incremental(pasta):
+    """Remove e devolve cada CSV, comparando a recarga incremental com a carga completa.
+
+    Retorna a lista de divergências (vazia se tudo bateu).
+    """
+    _apontar_app_para(pasta)
+    divergencias = []
+    removidos = os.path.join(pasta, 'removidos')
+    os.makedirs(removidos, exist_ok=True)
+
+    def conferir(descricao):
+        incremental = _estado_carregado()
+        _descarregar()
+        shutil.rmtree(app.CAMINHO_CACHE, ignore_errors=True)
+        app.carregar_dados_consolidados()
+        completo = _estado_carregado()
+        try:
+            pd.testing.assert_frame_equal(incremental[0], completo[0])
+        except AssertionError as e:
+            divergencias.append(f"{descricao}: DF difere da carga completa ({str(e).splitlines()[0]})")
+        if incremental[1] != completo[1]:
+            divergencias.append(f"{descricao}: gráficos diferem da carga completa")
+
+    for nome in sorted(n for n in os.listdir(pasta) if n.endswith('.csv')):
+        _descarregar()
+        app.carregar_dados_consolidados()
+        shutil.move(os.path.join(pasta, nome), removidos)
+        app.atualizar_arquivos_alterados()
+        conferir(f"removendo {nome}")
+        shutil.move(os.path.join(removidos, nome), pasta)
+        app.atualizar_arquivos_alterados()
+        conferir(f"devolvendo {nome}")
+    return divergencias
+
+
+def _pico_carga_streaming(pasta, orcamento):
+    """Pico de RSS (MB) da gravação do snapshot em streaming; roda num processo novo.
+
+    Mede só a leitura dos CSVs até o snapshot gravado: abrir o DF depois ocupa,
+    naturalmente, memória proporcional aos dados.
+    """
+    _apontar_app_para(pasta)
+    app.ORCAMENTO_CARGA = orcamento
+    os.makedirs(app.CAMINHO_CACHE, exist_ok=True)
+    arquivos = app._listar_arquivos_csv()
+    with _medir_pico_rss() as memoria:
+        app.construir_snapshot_streaming(arquivos, app._assinar_arquivos(arquivos))
+    return memoria['pico_mb']
+
+
+def verificar_memoria_streaming(linhas, fundos, semente, tolerancia):
+    """Compara o pico de RSS da carga em streaming com 'linhas' e com 4x 'linhas'.
+
+    Retorna a lista de problemas (vazia se o pico ficou dentro da tolerância).
+    """
+    fundos = fundos or max(1, linhas // 40)
+    picos = {}
+    # spawn: cada carga num processo limpo, sem a memória dos dados gerados aqui
+    contexto = multiprocessing.get_context('spawn')
+    for total in (linhas, linhas * 4):
+        pasta = tempfile.mkdtemp(prefix='cda_bench_')
+        try:
+            print(f"Gerando {total} posições sintéticas ({fundos} fundos) em {pasta}...")
+            gerar_dados(pasta, total, fundos=fundos, semente=semente)
+            with contexto.Pool(1) as processo:
+                picos[total] = processo.apply(_pico_carga_streaming, (pasta, app.ORCAMENTO_CARGA))
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+        print(f"⏱️  carga em streaming de {total} posições: pico RSS {picos[total]} MB")
+    if None in picos.values():
+        return ["Pico de memória indisponível nesta plataforma."]
+    menor, maior = picos[linhas], picos[linhas * 4]
+    if maior > menor * (1 + tolerancia):
+        return [f"Pico de RSS cresceu com as linhas: {menor} MB -> {maior} MB"]
+    return []
+
+
+def comparar(atual, base, tolerancia):
+    """Lista as etapas cujo p50 piorou mais que 'tolerancia' (fração) em relação à base."""
+    p50_base = {etapa['etapa']: etapa['p50_ms'] for etapa in base['etapas']}
+    regressoes = []
+    for etapa in atual['etapas']:
+        anterior = p50_base.get(etapa['etapa'])
+        if anterior and etapa['p50_ms'] > anterior * (1 + tolerancia):
+            regressoes.append((etapa['etapa'], anterior, etapa['p50_ms']))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga, filtro, página e download.")
+    parser.add_argument('--dados', help="Pasta com CSVs CDA já existentes (padrão: gera dados sintéticos)")
+    parser.add_argument('--linhas', type=int, default=500_000, help="Posições nos dados sintéticos")
+    parser.add_argument('--fundos', type=int, help="Nº de fundos nos dados sintéticos (padrão: linhas / 40)")
+    parser.add_argument('--repeticoes', type=int, default=30, help="Fundos medidos nas etapas por fundo")
+    parser.add_argument('--repeticoes-carga', type=int, default=3, help="Execuções de cada etapa de carga")
+    parser.add_argument('--modo-carga', choices=['completo', 'streaming'], default=app.MODO_CARGA,
+                        help="Modo de leitura dos CSVs (ver MODO_CARGA no app)")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--json', help="Grava o resultado neste arquivo")
+    parser.add_argument('--comparar', help="Resultado anterior (JSON) para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="Piora máxima aceita no p50 em relação à base (0.2 = 20%%)")
+    parser.add_argument('--verificar', action='store_true',
+                        help="Só confere a recarga incremental contra a carga completa")
+    parser.add_argument('--verificar-memoria', action='store_true',
+                        help="Só confere que o pico de memória da carga em streaming não cresce com as linhas")
+    args = parser.parse_args(argv)
+
+    if args.verificar_memoria:
+        problemas = verificar_memoria_streaming(args.linhas, args.fundos, args.semente, args.tolerancia)
+        for problema in problemas:
+            print(f"❌ {problema}")
+        if problemas:
+            return 1
+        print("✅ Pico de memória da carga em streaming estável com o nº de linhas.")
+        return 0
+
+    if args.dados:
+        # Copia para uma pasta temporária: o benchmark apaga e recria o cache
+        pasta = tempfile.mkdtemp(prefix='cda_bench_')
+        for nome in os.listdir(args.dados):
+            if nome.endswith('.csv'):
+                shutil.copy(os.path.join(args.dados, nome), pasta)
+    else:
+        pasta = tempfile.mkdtemp(prefix='cda_bench_')
+        print(f"Gerando {args.linhas} posições sintéticas em {pasta}...")
+        gerar_dados(pasta, args.linhas, fundos=args.fundos, semente=args.semente)
+
+    app.MODO_CARGA = args.modo_carga
+    if args.verificar:
+        try:
+            divergencias = verificar_incremental(pasta)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+        for divergencia in divergencias:
+            print(f"❌ {divergencia}")
+        if divergencias:
+            return 1
+        print("✅ Recarga incremental igual à carga completa.")
+        return 0
+
+    try:
+        resultado = executar(pasta, args.repeticoes, args.repeticoes_carga, args.semente)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    print(f"\n{resultado['linhas']} posições, {resultado['fundos']} fundos, "
+          f"{resultado['memoria_dados_mb']} MB em memória")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"✅ Resultado gravado em {args.json}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regressoes = comparar(resultado, base, args.tolerancia)
+        for etapa, anterior, atual in regressoes:
+            print(f"❌ Regressão em {etapa}: p50 {anterior} ms -> {atual} ms")
+        if regressoes:
+            return 1
+        print("✅ Nenhuma regressão acima da tolerância.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
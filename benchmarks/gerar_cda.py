@@ -0,0 +1,264 @@
+"""Gera arquivos CDA sintéticos (layout da CVM) em qualquer escala, para os benchmarks.
+
+Os arquivos seguem o formato dos reais: separados por ';', codificados em latin-1,
+um fundo por bloco de linhas contíguas, com os mesmos conjuntos de colunas de
+cda_fi_BLC_3 (swaps), cda_fi_BLC_4 (ações/derivativos), cda_fi_BLC_6 (crédito
+privado) e cda_fiim. O tamanho dos fundos segue uma distribuição de cauda longa,
+como na base real (poucos fundos com milhares de posições).
+
+Exemplo:
+    python benchmarks/gerar_cda.py /tmp/cda --linhas 2000000 --mes 202504
+"""
+import argparse
+import calendar
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_BASE = [
+    'TP_FUNDO_CLASSE', 'CNPJ_FUNDO_CLASSE', 'DENOM_SOCIAL', 'DT_COMPTC',
+]
+COLUNAS_POSICAO = [
+    'TP_APLIC', 'TP_ATIVO', 'EMISSOR_LIGADO', 'TP_NEGOC',
+    'QT_VENDA_NEGOC', 'VL_VENDA_NEGOC', 'QT_AQUIS_NEGOC', 'VL_AQUIS_NEGOC',
+    'QT_POS_FINAL', 'VL_MERC_POS_FINAL', 'VL_CUSTO_POS_FINAL', 'DT_CONFID_APLIC',
+]
+
+# Colunas de cada arquivo (BLC_4 modelado a partir das colunas que o app usa)
+LAYOUTS = {
+    'BLC_3': COLUNAS_BASE + COLUNAS_POSICAO + ['CD_SWAP', 'DS_SWAP'],
+    'BLC_4': COLUNAS_BASE + COLUNAS_POSICAO + [
+        'CD_ATIVO', 'DS_ATIVO', 'DT_INI_VIGENCIA', 'DT_FIM_VIGENCIA', 'CD_ISIN',
+        'CD_ATIVO_BV_MERC', 'DS_ATIVO_BV_MERC',
+    ],
+    'BLC_6': COLUNAS_BASE + COLUNAS_POSICAO + [
+        'PF_PJ_EMISSOR', 'CPF_CNPJ_EMISSOR', 'EMISSOR', 'DT_VENC', 'TITULO_POSFX',
+        'CD_INDEXADOR_POSFX', 'DS_INDEXADOR_POSFX', 'PR_INDEXADOR_POSFX', 'PR_CUPOM_POSFX',
+        'PR_TAXA_PREFX', 'TITULO_CETIP', 'TITULO_GARANTIA', 'CNPJ_INSTITUICAO_FINANC_COOBR',
+    ],
+    'fiim': COLUNAS_BASE + ['ID_DOC', 'VL_PATRIM_LIQ'] + COLUNAS_POSICAO + [
+        'CD_ATIVO', 'DS_ATIVO', 'DT_VENC', 'PF_PJ_EMISSOR', 'CPF_CNPJ_EMISSOR', 'EMISSOR',
+        'RISCO_EMISSOR', 'CD_SELIC', 'DT_INI_VIGENCIA', 'CD_PAIS', 'PAIS', 'CD_BV_MERC', 'BV_MERC',
+    ],
+}
+
+# Fração das linhas de cda_fi_BLC_* em cada bloco
+PROPORCAO_BLOCOS = {'BLC_3': 0.05, 'BLC_4': 0.45, 'BLC_6': 0.50}
+
+# (TP_APLIC, TP_ATIVO) de cada bloco, tirados dos arquivos reais
+APLICACOES = {
+    'BLC_3': [
+        ('DIFERENCIAL DE SWAP A PAGAR', 'SWAP'),
+        ('DIFERENCIAL DE SWAP A RECEBER', 'SWAP'),
+    ],
+    'BLC_4': [
+        ('Ações', 'Ação ordinária'),
+        ('Ações', 'Ação preferencial'),
+        ('Ações e outros TVM cedidos em empréstimo', 'Ação ordinária'),
+        ('Mercado Futuro - Posições compradas', 'Futuro'),
+        ('Mercado Futuro - Posições vendidas', 'Futuro'),
+        ('Opções - Posições titulares', 'Opção de compra'),
+    ],
+    'BLC_6': [
+        ('Debêntures', 'Debênture simples'),
+        ('Títulos ligados ao agronegócio', 'CRA'),
+        ('Títulos de Crédito Privado', 'Nota Promissória/ Commercial Paper/ Export Note'),
+        ('Títulos de Crédito Privado', 'CCI'),
+        ('Títulos de Crédito Privado', 'CCB'),
+        ('Títulos ligados ao agronegócio', 'LCA'),
+    ],
+    'fiim': [
+        ('AÇÕES', 'Ação ordinária'),
+        ('AÇÕES', 'Ação preferencial'),
+        ('AÇÕES E OUTROS TVM CEDIDOS EM EMPRÉSTIMO', 'Ação ordinária'),
+        ('VALORES A RECEBER', 'Outros'),
+        ('VALORES A PAGAR', 'Outros'),
+        ('COTAS DE FUNDOS', ''),
+    ],
+}
+
+PREFIXOS_NOME = [
+    'ITAÚ', 'BRADESCO', 'BB', 'CAIXA', 'SANTANDER', 'XP', 'BTG PACTUAL', 'SAFRA',
+    'KINEA', 'VERDE', 'SPX', 'ICATU', 'SICREDI', 'PORTO', 'ÓRAMA', 'GÁVEA',
+]
+ESTRATEGIAS = [
+    'RENDA FIXA REFERENCIADO DI', 'CRÉDITO PRIVADO', 'MULTIMERCADO', 'AÇÕES',
+    'CAMBIAL', 'INFRAESTRUTURA INCENTIVADO', 'PREVIDÊNCIA', 'LONGO PRAZO',
+]
+
+# Linhas geradas e gravadas por vez (limita a memória do gerador)
+TAMANHO_LOTE = 250_000
+
+
+def _cnpj(numeros):
+    """Formata inteiros como CNPJ (00.000.000/0001-00), sem validar o dígito."""
+    base = np.char.zfill((np.asarray(numeros) % 10**8).astype(str), 8)
+    digitos = np.char.zfill((np.asarray(numeros) % 97).astype(str), 2)
+    return np.array([f'{b[:2]}.{b[2:5]}.{b[5:]}/0001-{d}' for b, d in zip(base, digitos)])
+
+
+def _nomes_fundos(n, rng):
+    prefixos = rng.choice(PREFIXOS_NOME, n)
+    estrategias = rng.choice(ESTRATEGIAS, n)
+    return np.array([
+        f'{p} {e} {i:06d} FIF RESPONSABILIDADE LIMITADA'
+        for i, (p, e) in enumerate(zip(prefixos, estrategias))
+    ])
+
+
+def _tamanhos_fundos(n, rng):
+    """Pesos dos fundos: lognormal (a maioria pequena, alguns muito grandes)."""
+    pesos = rng.lognormal(mean=0.0, sigma=1.5, size=n)
+    return pesos / pesos.sum()
+
+
+def _valores(rng, n, casas, escala=1e6, vazios=0.0):
+    valores = np.round(rng.lognormal(np.log(escala), 1.5, n), casas)
+    if vazios:
+        valores[rng.random(n) < vazios] = np.nan
+    return valores
+
+
+def _datas(rng, n, inicio, dias, vazios=0.0):
+    datas = (np.datetime64(inicio) + rng.integers(0, dias, n)).astype(str).astype(object)
+    if vazios:
+        datas[rng.random(n) < vazios] = None
+    return datas
+
+
+def _gerar_lote(bloco, fundos, ctx, rng):
+    """DataFrame com as linhas (já na ordem dos fundos) de um lote do arquivo."""
+    n = len(fundos)
+    dados = {
+        'TP_FUNDO_CLASSE': 'CLASSES FIIM' if bloco == 'fiim' else 'CLASSES - FIF',
+        'CNPJ_FUNDO_CLASSE': ctx['cnpjs'][fundos],
+        'DENOM_SOCIAL': ctx['nomes'][fundos],
+        'DT_COMPTC': ctx['data_competencia'],
+    }
+    aplicacoes = APLICACOES[bloco]
+    escolhidas = rng.integers(0, len(aplicacoes), n)
+    dados['TP_APLIC'] = np.array([a for a, _ in aplicacoes])[escolhidas]
+    dados['TP_ATIVO'] = np.array([t for _, t in aplicacoes])[escolhidas]
+    dados['EMISSOR_LIGADO'] = np.where(rng.random(n) < 0.05, 'S', 'N')
+    dados['TP_NEGOC'] = np.where(rng.random(n) < 0.8, 'Para negociação', 'Mantido até o vencimento')
+    for coluna in ['QT_VENDA_NEGOC', 'QT_AQUIS_NEGOC']:
+        dados[coluna] = _valores(rng, n, 6, escala=1e3, vazios=0.9)
+    for coluna in ['VL_VENDA_NEGOC', 'VL_AQUIS_NEGOC']:
+        dados[coluna] = _valores(rng, n, 2, vazios=0.9)
+    dados['QT_POS_FINAL'] = _valores(rng, n, 6, escala=1e3)
+    dados['VL_MERC_POS_FINAL'] = _valores(rng, n, 2)
+    if bloco == 'BLC_3':
+        # Swaps a pagar entram negativos, como nos arquivos da CVM
+        dados['VL_MERC_POS_FINAL'] = np.where(escolhidas == 0, -1, 1) * dados['VL_MERC_POS_FINAL']
+    dados['VL_CUSTO_POS_FINAL'] = _valores(rng, n, 2, vazios=0.5)
+    dados['DT_CONFID_APLIC'] = _datas(rng, n, ctx['inicio_mes'], 120, vazios=0.9)
+
+    emissores = rng.integers(0, len(ctx['emissores']), n)
+    ativos = rng.integers(0, len(ctx['ativos']), n)
+    extras = {
+        'CD_SWAP': lambda: rng.choice(['SDE', 'SPR', 'Outros'], n),
+        'DS_SWAP': lambda: rng.choice(['DI1 X PRE', 'DI1 X IPCA', '999 X 999'], n),
+        'CD_ATIVO': lambda: ctx['ativos'][ativos],
+        'CD_ATIVO_BV_MERC': lambda: ctx['ativos'][ativos],
+        'DS_ATIVO': lambda: ctx['descricoes_ativos'][ativos],
+        'DS_ATIVO_BV_MERC': lambda: ctx['descricoes_ativos'][ativos],
+        'CD_ISIN': lambda: np.char.add('BR', ctx['ativos'][ativos]),
+        'DT_INI_VIGENCIA': lambda: _datas(rng, n, '2020-01-01', 1800, vazios=0.5),
+        'DT_FIM_VIGENCIA': lambda: _datas(rng, n, ctx['inicio_mes'], 720, vazios=0.8),
+        'DT_VENC': lambda: _datas(rng, n, ctx['inicio_mes'], 3650),
+        'PF_PJ_EMISSOR': lambda: np.full(n, 'PJ'),
+        'CPF_CNPJ_EMISSOR': lambda: ctx['cnpjs_emissores'][emissores],
+        'EMISSOR': lambda: ctx['emissores'][emissores],
+        'TITULO_POSFX': lambda: np.where(rng.random(n) < 0.7, 'S', 'N'),
+        'CD_INDEXADOR_POSFX': lambda: np.full(n, 'DI1'),
+        'DS_INDEXADOR_POSFX': lambda: np.full(n, 'DI de um dia'),
+        'PR_INDEXADOR_POSFX': lambda: np.full(n, 100.0),
+        'PR_CUPOM_POSFX': lambda: np.round(rng.uniform(0.5, 3.0, n), 6),
+        'PR_TAXA_PREFX': lambda: np.where(rng.random(n) < 0.3, np.round(rng.uniform(8, 15, n), 6), np.nan),
+        'TITULO_CETIP': lambda: np.where(rng.random(n) < 0.9, 'S', 'N'),
+        'TITULO_GARANTIA': lambda: np.where(rng.random(n) < 0.2, 'S', 'N'),
+        'ID_DOC': lambda: 800_000 + fundos,
+        'VL_PATRIM_LIQ': lambda: ctx['patrimonios'][fundos],
+    }
+    for coluna in LAYOUTS[bloco]:
+        if coluna not in dados:
+            gerar = extras.get(coluna)
+            dados[coluna] = gerar() if gerar else None
+    return pd.DataFrame(dados, columns=LAYOUTS[bloco])
+
+
+def _contexto(fundos, mes, rng):
+    ano, numero_mes = int(mes[:4]), int(mes[4:])
+    ultimo_dia = calendar.monthrange(ano, numero_mes)[1]
+    n_emissores = max(50, fundos // 5)
+    n_ativos = max(100, fundos // 2)
+    codigos = np.array([
+        ''.join(chr(65 + (i // 26**k) % 26) for k in range(4)) for i in range(n_ativos)
+    ])
+    return {
+        'nomes': _nomes_fundos(fundos, rng),
+        'cnpjs': _cnpj(np.arange(fundos) * 7919 + 1_000_000),
+        'pesos': _tamanhos_fundos(fundos, rng),
+        'patrimonios': _valores(rng, fundos, 2, escala=1e8),
+        'emissores': np.array([f'EMISSORA SINTÉTICA {i:05d} S.A.' for i in range(n_emissores)]),
+        'cnpjs_emissores': _cnpj(np.arange(n_emissores) * 104_729 + 3_000_000),
+        'ativos': np.char.add(codigos, rng.choice(['3', '4', '11'], n_ativos)),
+        'descricoes_ativos': np.array([f'ATIVO {c}' for c in codigos]),
+        'data_competencia': f'{ano:04d}-{numero_mes:02d}-{ultimo_dia:02d}',
+        'inicio_mes': f'{ano:04d}-{numero_mes:02d}-01',
+    }
+
+
+def gerar_arquivo(caminho, bloco, linhas, ctx, rng):
+    """Grava um arquivo do bloco com 'linhas' posições, em lotes."""
+    # Sorteia o fundo de cada linha (fundos grandes aparecem mais) e agrupa por fundo
+    fundos = np.sort(rng.choice(len(ctx['nomes']), size=linhas, p=ctx['pesos']))
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        for inicio in range(0, max(linhas, 1), TAMANHO_LOTE):
+            lote = _gerar_lote(bloco, fundos[inicio:inicio + TAMANHO_LOTE], ctx, rng)
+            lote.to_csv(f, sep=';', index=False, header=inicio == 0, lineterminator='\n')
+
+
+def gerar_dados(pasta, linhas, mes='202504', fundos=None, linhas_fiim=None, semente=42):
+    """Gera os cda_fi_BLC_* (total de 'linhas' posições) e o cda_fiim de um mês.
+
+    Retorna a lista de arquivos gravados.
+    """
+    rng = np.random.default_rng(semente)
+    fundos = fundos or max(1, linhas // 40)
+    linhas_fiim = linhas // 4 if linhas_fiim is None else linhas_fiim
+    ctx = _contexto(fundos, mes, rng)
+    os.makedirs(pasta, exist_ok=True)
+
+    arquivos = []
+    for bloco, proporcao in PROPORCAO_BLOCOS.items():
+        caminho = os.path.join(pasta, f'cda_fi_{bloco}_{mes}.csv')
+        gerar_arquivo(caminho, bloco, int(linhas * proporcao), ctx, rng)
+        arquivos.append(caminho)
+    if linhas_fiim:
+        caminho = os.path.join(pasta, f'cda_fiim_{mes}.csv')
+        gerar_arquivo(caminho, 'fiim', linhas_fiim, ctx, rng)
+        arquivos.append(caminho)
+    return arquivos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera arquivos CDA sintéticos no layout da CVM.")
+    parser.add_argument('pasta', help="Pasta de saída")
+    parser.add_argument('--linhas', type=int, default=1_000_000, help="Total de posições nos cda_fi_BLC_*")
+    parser.add_argument('--fundos', type=int, help="Nº de fundos (padrão: linhas / 40)")
+    parser.add_argument('--linhas-fiim', type=int, help="Posições no cda_fiim (padrão: linhas / 4; 0 = não gera)")
+    parser.add_argument('--mes', default='202504', help="Mês de competência (AAAAMM)")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    arquivos = gerar_dados(args.pasta, args.linhas, args.mes, args.fundos, args.linhas_fiim, args.semente)
+    for caminho in arquivos:
+        print(f"📄 {caminho}: {os.path.getsize(caminho) / 2**20:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Exportação em lote pela linha de comando (mesma lógica do POST /api/lote).
+
+Exemplos:
+    python exportar_lote.py -s risco.xlsx "FUNDO A" 00.832.435/0001-00
+    python exportar_lote.py -s risco.csv --layout longo --arquivo fundos.txt
+"""
+import argparse
+import os
+import sys
+
+import app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta as posições de vários fundos de uma vez.")
+    parser.add_argument('fundos', nargs='*', help="Nomes (DENOM_SOCIAL) ou CNPJs dos fundos")
+    parser.add_argument('-a', '--arquivo', help="Arquivo texto com um fundo (nome ou CNPJ) por linha")
+    parser.add_argument('-s', '--saida', required=True, help="Arquivo de saída (.xlsx, .csv ou .parquet)")
+    parser.add_argument('--layout', choices=app.LAYOUTS_LOTE, default='abas',
+                        help="'abas': uma aba por fundo (só xlsx); 'longo': todos numa tabela")
+    args = parser.parse_args(argv)
+
+    fundos = list(args.fundos)
+    if args.arquivo:
+        with open(args.arquivo, encoding='utf-8') as f:
+            fundos.extend(linha.strip() for linha in f if linha.strip())
+    if not fundos:
+        parser.error("Informe ao menos um fundo (argumentos ou --arquivo).")
+
+    formato = os.path.splitext(args.saida)[1].lstrip('.').lower()
+    if formato not in app.FORMATOS_EXPORTACAO:
+        parser.error(f"Extensão de saída não suportada: .{formato}")
+
+    df = app.carregar_dados_consolidados()
+    df_lote, nao_encontrados = app.preparar_lote(df, fundos)
+    for fundo in nao_encontrados:
+        print(f"⚠️ Fundo não encontrado: {fundo}", file=sys.stderr)
+    if df_lote.empty:
+        print("❌ Nenhum dos fundos informados foi encontrado.", file=sys.stderr)
+        return 1
+
+    app.escrever_lote(df_lote, args.saida, formato, args.layout)
+    total_fundos = df_lote[app.COLUNA_FILTRO].nunique()
+    print(f"✅ {len(df_lote)} posições de {total_fundos} fundo(s) exportadas em {args.saida}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+# ----------------------------------------------------
+# CONFIGURAÇÃO DO GUNICORN
+# Uso: gunicorn -c gunicorn.conf.py app:app
+# ----------------------------------------------------
+import multiprocessing
+import os
+import re
+
+bind = os.environ.get('CDA_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('CDA_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Importa o app.py uma única vez no processo mestre: os dados são carregados antes
+# dos forks e compartilhados pelos workers (copy-on-write + snapshot mapeado em memória)
+preload_app = True
+
+# Métricas somadas entre os workers: cada um grava as suas nesta pasta e o /metrics
+# de qualquer worker soma todas. A cada início do servidor saem só os arquivos de
+# métricas do app (<pid>_<início>.json e temporários): a pasta pode ser compartilhada
+# (definida antes do preload, pois o app.py a lê na importação)
+os.environ.setdefault('CDA_METRICAS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', '.cache', 'metricas'))
+if os.path.isdir(os.environ['CDA_METRICAS_DIR']):
+    for nome in os.listdir(os.environ['CDA_METRICAS_DIR']):
+        if re.fullmatch(r'\d+_\d+\.json(\.\d+_\d+\.tmp)?', nome):
+            os.remove(os.path.join(os.environ['CDA_METRICAS_DIR'], nome))
+
+
+def when_ready(server):
+    import app
+    server.log.info("Carregando dados no processo mestre...")
+    app.preparar_para_fork()
+
+
+def post_fork(server, worker):
+    # Cada worker tenta iniciar o watcher da pasta dados/; só um fica com a trava.
+    # Todos verificam, numa thread, se há snapshot novo (fora das requisições)
+    import app
+    app.iniciar_watcher()
+    app.iniciar_verificador_snapshot()